@@ -0,0 +1,307 @@
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urljoin, urlparse
+
+import requests
+
+from downloader import (
+    DEFAULT_NATIVE_CONNECTIONS,
+    DEFAULT_PROBE_BYTES,
+    DEFAULT_SELECT,
+    derive_output_filename,
+    download_resolution,
+    fetch_page,
+    invalidate_episode,
+)
+from probe import check_link
+from resolver import Resolution, download_with_refresh, invalidate_resolution, resolve_episode_url
+from sessions import get_session
+
+
+EPISODE_PATH_RE = re.compile(r"/stream/([^/]+)/staffel-(\d+)/episode-(\d+)/?$")
+SEASON_PATH_RE = re.compile(r"/stream/([^/]+)/staffel-(\d+)/?$")
+SERIES_PATH_RE = re.compile(r"/stream/([^/]+)/?$")
+FILM_PATH_RE = re.compile(r"/stream/([^/]+)/filme/film-(\d+)/?$")
+FILMS_PATH_RE = re.compile(r"/stream/([^/]+)/filme/?$")
+FILMS_SEASON = 0
+HREF_RE = re.compile(r"""href=["']([^"'#?]+)["']""")
+PREFETCH_REVALIDATE_AFTER = 10.0
+
+
+def episode_of(url: str) -> Optional[Tuple[str, int, int]]:
+    path = urlparse(url).path
+    match = EPISODE_PATH_RE.search(path)
+    if match:
+        return match.group(1), int(match.group(2)), int(match.group(3))
+    match = FILM_PATH_RE.search(path)
+    if match:
+        return match.group(1), FILMS_SEASON, int(match.group(2))
+    return None
+
+
+def season_of(url: str) -> Optional[Tuple[str, int]]:
+    path = urlparse(url).path
+    match = SEASON_PATH_RE.search(path)
+    if match:
+        return match.group(1), int(match.group(2))
+    match = FILMS_PATH_RE.search(path)
+    if match:
+        return match.group(1), FILMS_SEASON
+    return None
+
+
+def is_collection_url(url: str) -> bool:
+    return season_of(url) is not None or SERIES_PATH_RE.search(urlparse(url).path) is not None
+
+
+def _linked_paths(html: str, base_url: str, pattern: re.Pattern, slug: str) -> List[Tuple[str, re.Match]]:
+    seen = set()
+    links = []
+    for href in HREF_RE.findall(html):
+        url = urljoin(base_url, href)
+        match = pattern.search(urlparse(url).path)
+        if not match or match.group(1) != slug or url in seen:
+            continue
+        seen.add(url)
+        links.append((url, match))
+    return links
+
+
+def season_episode_links(html: str, season_url: str) -> List[Tuple[int, str]]:
+    parsed = season_of(season_url)
+    if parsed is None:
+        raise ValueError(f"Not a season URL: {season_url}")
+    slug, season = parsed
+    if season == FILMS_SEASON:
+        return sorted(
+            (int(m.group(2)), url) for url, m in _linked_paths(html, season_url, FILM_PATH_RE, slug)
+        )
+    return sorted(
+        (int(m.group(3)), url)
+        for url, m in _linked_paths(html, season_url, EPISODE_PATH_RE, slug)
+        if int(m.group(2)) == season
+    )
+
+
+def series_season_links(html: str, series_url: str) -> List[Tuple[int, str]]:
+    match = SERIES_PATH_RE.search(urlparse(series_url).path)
+    if not match:
+        raise ValueError(f"Not a series URL: {series_url}")
+    slug = match.group(1)
+    seasons = sorted(
+        (int(m.group(2)), url) for url, m in _linked_paths(html, series_url, SEASON_PATH_RE, slug)
+    )
+    films = [(FILMS_SEASON, url) for url, _ in _linked_paths(html, series_url, FILMS_PATH_RE, slug)]
+    return seasons + films[:1]
+
+
+def enumerate_season(season_url: str, session: Optional[requests.Session] = None) -> List[str]:
+    if season_of(season_url) is None:
+        raise ValueError(f"Not a season URL: {season_url}")
+    html = fetch_page(season_url, session=session).text
+    return [url for _, url in season_episode_links(html, season_url)]
+
+
+def enumerate_series(series_url: str, session: Optional[requests.Session] = None) -> List[str]:
+    if not SERIES_PATH_RE.search(urlparse(series_url).path):
+        raise ValueError(f"Not a series URL: {series_url}")
+    html = fetch_page(series_url, session=session).text
+    episode_urls: List[str] = []
+    for _, season_url in series_season_links(html, series_url):
+        episode_urls.extend(enumerate_season(season_url, session=session))
+    return episode_urls
+
+
+def enumerate_episodes(url: str, session: Optional[requests.Session] = None) -> List[str]:
+    if episode_of(url) is not None:
+        return [url]
+    if season_of(url) is not None:
+        return enumerate_season(url, session=session)
+    if SERIES_PATH_RE.search(urlparse(url).path):
+        return enumerate_series(url, session=session)
+    raise ValueError(f"Not an aniworld series, season, film or episode URL: {url}")
+
+
+def run_batch_episodes(
+    episode_urls: List[str],
+    output_dir: str,
+    language_key: int = 3,
+    select: str = DEFAULT_SELECT,
+    probe_bytes: int = DEFAULT_PROBE_BYTES,
+    resolve_workers: int = 4,
+    download_workers: int = 2,
+    engine: str = "yt-dlp",
+    connections: int = DEFAULT_NATIVE_CONNECTIONS,
+) -> Dict[str, str]:
+    failures: Dict[str, str] = {}
+    lock = threading.Lock()
+    slots = threading.BoundedSemaphore(resolve_workers + download_workers)
+
+    def _fail(episode_url: str, stage: str, err: Exception) -> None:
+        logging.error(f"{stage} failed for {episode_url}: {err}")
+        with lock:
+            failures[episode_url] = f"{stage} failed: {err}"
+
+    def _download(episode_url: str, resolution, output_path: str) -> None:
+        slots.release()
+        logging.info(f"Downloading {episode_url} from {resolution.provider} to {output_path}")
+        try:
+            _download_episode(episode_url, resolution, output_path, engine, connections)
+        except Exception as err:
+            invalidate_resolution(resolution)
+            _fail(episode_url, "Download", err)
+            return
+        logging.info(f"Download completed: {output_path}")
+
+    def _resolve(episode_url: str, download_pool: ThreadPoolExecutor) -> None:
+        try:
+            resolution = resolve_episode_url(episode_url, language_key, select, probe_bytes)
+        except Exception as err:
+            slots.release()
+            invalidate_episode(episode_url)
+            _fail(episode_url, "Resolution", err)
+            return
+        output_path = os.path.join(output_dir, derive_output_filename(episode_url))
+        download_pool.submit(_download, episode_url, resolution, output_path)
+
+    with ThreadPoolExecutor(max_workers=download_workers) as download_pool:
+        with ThreadPoolExecutor(max_workers=resolve_workers) as resolve_pool:
+            for episode_url in episode_urls:
+                slots.acquire()
+                resolve_pool.submit(_resolve, episode_url, download_pool)
+
+    return failures
+
+
+def _download_episode(
+    episode_url: str, resolution: Resolution, output_path: str, engine: str, connections: int
+) -> None:
+    download_with_refresh(
+        resolution,
+        output_path,
+        lambda current: download_resolution(
+            current.direct_link, output_path, current.provider, engine, connections
+        ),
+        episode_url,
+    )
+
+
+def _prepare_episode(
+    episode_url: str, language_key: int, select: str, probe_bytes: int, engine: str
+) -> Tuple[Resolution, float]:
+    resolution = resolve_episode_url(episode_url, language_key, select, probe_bytes)
+    if engine == "native" and not check_link(resolution.direct_link, get_session(resolution.provider)):
+        invalidate_resolution(resolution)
+        resolution = resolve_episode_url(episode_url, language_key, select, probe_bytes)
+    return resolution, time.monotonic()
+
+
+def run_batch_pipelined(
+    episode_urls: List[str],
+    output_dir: str,
+    language_key: int = 3,
+    select: str = DEFAULT_SELECT,
+    probe_bytes: int = DEFAULT_PROBE_BYTES,
+    engine: str = "yt-dlp",
+    connections: int = DEFAULT_NATIVE_CONNECTIONS,
+) -> Dict[str, str]:
+    failures: Dict[str, str] = {}
+
+    def _fail(episode_url: str, stage: str, err: Exception) -> None:
+        logging.error(f"{stage} failed for {episode_url}: {err}")
+        failures[episode_url] = f"{stage} failed: {err}"
+
+    with ThreadPoolExecutor(max_workers=1) as prefetch_pool:
+        pending: Optional[Future] = None
+        for index, episode_url in enumerate(episode_urls):
+            current = pending or prefetch_pool.submit(
+                _prepare_episode, episode_url, language_key, select, probe_bytes, engine
+            )
+            pending = None
+            if index + 1 < len(episode_urls):
+                pending = prefetch_pool.submit(
+                    _prepare_episode,
+                    episode_urls[index + 1],
+                    language_key,
+                    select,
+                    probe_bytes,
+                    engine,
+                )
+
+            try:
+                resolution, prepared_at = current.result()
+                if time.monotonic() - prepared_at > PREFETCH_REVALIDATE_AFTER and not check_link(
+                    resolution.direct_link, get_session(resolution.provider)
+                ):
+                    logging.info(f"Prefetched link for {episode_url} expired, resolving again")
+                    invalidate_resolution(resolution)
+                    resolution = resolve_episode_url(episode_url, language_key, select, probe_bytes)
+            except Exception as err:
+                invalidate_episode(episode_url)
+                _fail(episode_url, "Resolution", err)
+                continue
+
+            output_path = os.path.join(output_dir, derive_output_filename(episode_url))
+            logging.info(f"Downloading {episode_url} from {resolution.provider} to {output_path}")
+            try:
+                _download_episode(episode_url, resolution, output_path, engine, connections)
+            except Exception as err:
+                invalidate_resolution(resolution)
+                _fail(episode_url, "Download", err)
+                continue
+            logging.info(f"Download completed: {output_path}")
+
+    return failures
+
+
+def run_batch(
+    url: str,
+    output_dir: str,
+    language_key: int = 3,
+    select: str = DEFAULT_SELECT,
+    probe_bytes: int = DEFAULT_PROBE_BYTES,
+    resolve_workers: int = 4,
+    download_workers: int = 2,
+    engine: str = "yt-dlp",
+    connections: int = DEFAULT_NATIVE_CONNECTIONS,
+    pipelined: bool = False,
+) -> Dict[str, str]:
+    try:
+        episode_urls = enumerate_episodes(url)
+    except (requests.RequestException, ValueError) as err:
+        logging.error(f"Failed to enumerate episodes: {err}")
+        return {url: f"Enumeration failed: {err}"}
+
+    logging.info(f"Found {len(episode_urls)} episodes for {url}")
+    if pipelined:
+        failures = run_batch_pipelined(
+            episode_urls,
+            output_dir,
+            language_key=language_key,
+            select=select,
+            probe_bytes=probe_bytes,
+            engine=engine,
+            connections=connections,
+        )
+    else:
+        failures = run_batch_episodes(
+            episode_urls,
+            output_dir,
+            language_key=language_key,
+            select=select,
+            probe_bytes=probe_bytes,
+            resolve_workers=resolve_workers,
+            download_workers=download_workers,
+            engine=engine,
+            connections=connections,
+        )
+    logging.info(
+        f"Batch finished: {len(episode_urls) - len(failures)} succeeded, "
+        f"{len(failures)} failed"
+    )
+    return failures
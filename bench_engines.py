@@ -0,0 +1,246 @@
+import argparse
+import hashlib
+import importlib.util
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Tuple
+
+from downloader import (
+    DEFAULT_FRAGMENT_RETRIES,
+    DEFAULT_NATIVE_CONNECTIONS,
+    LinkExpiredError,
+    build_ytdl_command,
+    run_download,
+)
+from segmented import download_native
+
+
+RANGE_RE = re.compile(r"bytes=(\d+)-(\d*)")
+SEND_BLOCK_SIZE = 64 * 1024
+EXPIRY_TIMEOUT = 60.0
+
+
+class MediaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, payload: bytes, segment_count: int, per_connection_rate: float):
+        super().__init__(("127.0.0.1", 0), MediaHandler)
+        self.payload = payload
+        self.per_connection_rate = per_connection_rate
+        self.rejected = 0
+        self._rejected_lock = threading.Lock()
+        segment_size = -(-len(payload) // segment_count)
+        self.segments = [
+            payload[start:start + segment_size] for start in range(0, len(payload), segment_size)
+        ]
+
+    def handle_error(self, request, client_address) -> None:
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address
+        return f"http://{host}:{port}"
+
+    def playlist(self) -> bytes:
+        lines = ["#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-TARGETDURATION:4", "#EXT-X-MEDIA-SEQUENCE:0"]
+        for index in range(len(self.segments)):
+            lines.extend(["#EXTINF:4.0,", f"seg{index}.ts"])
+        lines.append("#EXT-X-ENDLIST")
+        return ("\n".join(lines) + "\n").encode()
+
+    def reject(self) -> None:
+        with self._rejected_lock:
+            self.rejected += 1
+
+
+class MediaHandler(BaseHTTPRequestHandler):
+    server: MediaServer
+    protocol_version = "HTTP/1.1"
+
+    def _send_body(self, body: bytes) -> None:
+        rate = self.server.per_connection_rate
+        start = time.monotonic()
+        for offset in range(0, len(body), SEND_BLOCK_SIZE):
+            self.wfile.write(body[offset:offset + SEND_BLOCK_SIZE])
+            if rate:
+                delay = (offset + SEND_BLOCK_SIZE) / rate - (time.monotonic() - start)
+                if delay > 0:
+                    time.sleep(delay)
+
+    def _respond(self, body: bytes, content_type: str, head: bool = False) -> None:
+        range_match = RANGE_RE.fullmatch(self.headers.get("Range", ""))
+        if range_match:
+            start = int(range_match.group(1))
+            end = int(range_match.group(2)) if range_match.group(2) else len(body) - 1
+            end = min(end, len(body) - 1)
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(body)}")
+            body = body[start:end + 1]
+        else:
+            self.send_response(200)
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if not head:
+            self._send_body(body)
+
+    def _route(self, head: bool) -> None:
+        path = self.path.split("?", 1)[0]
+        if path == "/video.mp4":
+            self._respond(self.server.payload, "video/mp4", head)
+        elif path == "/hls/index.m3u8":
+            self._respond(self.server.playlist(), "application/vnd.apple.mpegurl", head)
+        elif path.startswith("/hls/seg") and path.endswith(".ts"):
+            index = int(path[len("/hls/seg"):-len(".ts")])
+            self._respond(self.server.segments[index], "video/mp2t", head)
+        elif path == "/expired/index.m3u8":
+            self._respond(self.server.playlist(), "application/vnd.apple.mpegurl", head)
+        elif path == "/expired/seg0.ts":
+            self._respond(self.server.segments[0], "video/mp2t", head)
+        elif path.startswith("/expired/seg"):
+            self.server.reject()
+            self.send_error(403)
+        else:
+            self.send_error(404)
+
+    def do_GET(self) -> None:
+        self._route(head=False)
+
+    def do_HEAD(self) -> None:
+        self._route(head=True)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+def run_case(name: str, func: Callable[[str], None], output_dir: str, expected: bytes) -> Dict:
+    output_path = os.path.join(output_dir, f"{name}.bin")
+    start = time.perf_counter()
+    try:
+        func(output_path)
+    except Exception as err:
+        return {"name": name, "ok": False, "error": str(err)}
+    elapsed = time.perf_counter() - start
+    with open(output_path, "rb") as handle:
+        digest = hashlib.sha256(handle.read()).hexdigest()
+    return {
+        "name": name,
+        "ok": digest == hashlib.sha256(expected).hexdigest(),
+        "seconds": elapsed,
+        "mib_per_second": len(expected) / elapsed / 1024 / 1024,
+    }
+
+
+def run_expiry_case(name: str, func: Callable[[str], None], output_dir: str, server: MediaServer) -> Dict:
+    output_path = os.path.join(output_dir, f"{name}.bin")
+    outcome: Dict[str, BaseException] = {}
+
+    def _target() -> None:
+        try:
+            func(output_path)
+        except BaseException as err:
+            outcome["error"] = err
+
+    server.rejected = 0
+    start = time.perf_counter()
+    thread = threading.Thread(target=_target, daemon=True)
+    thread.start()
+    thread.join(EXPIRY_TIMEOUT)
+    elapsed = time.perf_counter() - start
+    if thread.is_alive():
+        error = f"still running after {EXPIRY_TIMEOUT:.0f}s and {server.rejected} rejected requests"
+        return {"name": name, "ok": False, "error": error}
+    err = outcome.get("error")
+    if not isinstance(err, LinkExpiredError):
+        return {"name": name, "ok": False, "error": f"expected LinkExpiredError, got {err!r}"}
+    return {
+        "name": name,
+        "ok": server.rejected <= (DEFAULT_FRAGMENT_RETRIES + 1) * len(server.segments),
+        "seconds": elapsed,
+        "rejected": server.rejected,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Compare the native segmented engine with yt-dlp on a local server."
+    )
+    parser.add_argument("--size-mib", type=int, default=64)
+    parser.add_argument("--segments", type=int, default=32)
+    parser.add_argument("--connections", type=int, default=DEFAULT_NATIVE_CONNECTIONS)
+    parser.add_argument(
+        "--per-connection-kib",
+        type=int,
+        default=4096,
+        help="server-side rate limit per connection in KiB/s (0 = unlimited)",
+    )
+    parser.add_argument("--skip-ytdlp", action="store_true")
+    args = parser.parse_args()
+
+    payload = os.urandom(args.size_mib * 1024 * 1024)
+    server = MediaServer(payload, args.segments, args.per_connection_kib * 1024)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    output_dir = tempfile.mkdtemp(prefix="aniworld-bench-")
+
+    direct_url = f"{server.base_url}/video.mp4"
+    hls_url = f"{server.base_url}/hls/index.m3u8"
+    expired_url = f"{server.base_url}/expired/index.m3u8"
+    cases: List[Tuple[str, Callable[[str], None]]] = [
+        ("native-direct", lambda path: download_native(direct_url, path, connections=args.connections)),
+        ("native-hls", lambda path: download_native(hls_url, path, connections=args.connections)),
+    ]
+    if not args.skip_ytdlp and shutil.which("yt-dlp"):
+        ytdl_extra = ["--hls-prefer-native", "--no-progress"]
+        cases.extend([
+            ("yt-dlp-direct", lambda path: run_download(build_ytdl_command(direct_url, path, "") + ytdl_extra)),
+            ("yt-dlp-hls", lambda path: run_download(build_ytdl_command(hls_url, path, "") + ytdl_extra)),
+        ])
+    expiry_cases: List[Tuple[str, Callable[[str], None]]] = [
+        ("native-expired", lambda path: download_native(expired_url, path, connections=args.connections)),
+    ]
+    if not args.skip_ytdlp and shutil.which("yt-dlp"):
+        expiry_cases.append(
+            ("yt-dlp-expired", lambda path: run_download(build_ytdl_command(expired_url, path, "") + ytdl_extra))
+        )
+    if not args.skip_ytdlp and importlib.util.find_spec("yt_dlp"):
+        from pipeline import run_download_inprocess
+
+        expiry_cases.append(("in-process-expired", lambda path: run_download_inprocess(expired_url, path, "")))
+
+    try:
+        results = [run_case(name, func, output_dir, payload) for name, func in cases]
+        results += [run_expiry_case(name, func, output_dir, server) for name, func in expiry_cases]
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+    print(f"{'case':18} {'result':6} {'seconds':>8} {'MiB/s':>8}")
+    for result in results:
+        if "error" in result:
+            print(f"{result['name']:18} FAIL   {result['error']}")
+            continue
+        if "rejected" in result:
+            print(
+                f"{result['name']:18} {'ok' if result['ok'] else 'FAIL':6} "
+                f"{result['seconds']:8.2f} {'':8} {result['rejected']} rejected requests before giving up"
+            )
+            continue
+        print(
+            f"{result['name']:18} {'ok' if result['ok'] else 'FAIL':6} "
+            f"{result['seconds']:8.2f} {result['mib_per_second']:8.2f}"
+        )
+    sys.exit(0 if all(result["ok"] for result in results) else 1)
+
+
+if __name__ == "__main__":
+    main()
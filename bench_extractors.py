@@ -0,0 +1,248 @@
+import argparse
+import glob
+import json
+import os
+import re
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse, urlunparse
+
+import bs4
+import requests
+from requests.adapters import HTTPAdapter
+
+from providers import get_extractor
+
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "extractors")
+ORIGINAL_URL_HEADER = "X-Replay-Original-Url"
+
+
+class ReplayServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), ReplayHandler)
+        self.responses: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.lock = threading.Lock()
+        self.reset()
+
+    def load(self, fixture: Dict[str, Any]) -> None:
+        self.responses = {
+            (entry["method"].upper(), entry["url"]): entry for entry in fixture["responses"]
+        }
+        self.reset()
+
+    def reset(self) -> None:
+        with self.lock:
+            self.round_trips = 0
+            self.bytes_sent = 0
+            self.unexpected: List[str] = []
+
+    def record(self, sent: int, unexpected: Optional[str] = None) -> None:
+        with self.lock:
+            self.round_trips += 1
+            self.bytes_sent += sent
+            if unexpected:
+                self.unexpected.append(unexpected)
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    server: ReplayServer
+
+    def _replay(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+
+        original_url = self.headers.get(ORIGINAL_URL_HEADER, "")
+        entry = self.server.responses.get((self.command, original_url))
+        if entry is None:
+            body = b"no recorded response"
+            self.send_response(404)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if self.command != "HEAD":
+                self.wfile.write(body)
+            self.server.record(len(body), f"{self.command} {original_url}")
+            return
+
+        body = entry.get("body", "").encode("utf-8")
+        self.send_response(entry.get("status", 200))
+        for name, value in entry.get("headers", {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        sent = 0
+        if self.command != "HEAD":
+            self.wfile.write(body)
+            sent = len(body)
+        self.server.record(sent)
+
+    do_GET = _replay
+    do_HEAD = _replay
+    do_POST = _replay
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+class ReplayAdapter(HTTPAdapter):
+    def __init__(self, server_address: Tuple[str, int], **kwargs):
+        self.server_address = server_address
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        original_url = request.url
+        parsed = urlparse(original_url)
+        host, port = self.server_address
+        request.url = urlunparse(("http", f"{host}:{port}", parsed.path or "/", "", parsed.query, ""))
+        request.headers[ORIGINAL_URL_HEADER] = original_url
+        kwargs["verify"] = False
+        response = super().send(request, **kwargs)
+        response.url = original_url
+        request.url = original_url
+        return response
+
+
+class SoupCounter:
+    def __init__(self):
+        self.count = 0
+        self._original_init = bs4.BeautifulSoup.__init__
+
+    def __enter__(self) -> "SoupCounter":
+        counter = self
+        original_init = self._original_init
+
+        def counting_init(soup, *args, **kwargs):
+            counter.count += 1
+            original_init(soup, *args, **kwargs)
+
+        bs4.BeautifulSoup.__init__ = counting_init
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        bs4.BeautifulSoup.__init__ = self._original_init
+
+
+def replay_session(server: ReplayServer) -> requests.Session:
+    session = requests.Session()
+    adapter = ReplayAdapter(server.server_address)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def check_result(fixture: Dict[str, Any], direct_link: str) -> bool:
+    if "expected_pattern" in fixture:
+        return re.match(fixture["expected_pattern"], direct_link) is not None
+    return direct_link == fixture["expected"]
+
+
+def run_fixture(server: ReplayServer, fixture: Dict[str, Any], repeat: int) -> Dict[str, Any]:
+    provider = fixture["provider"]
+    extractor_func = get_extractor(provider)
+    report: Dict[str, Any] = {"provider": provider, "ok": False, "problems": []}
+    if extractor_func is None:
+        report["problems"].append("no extractor registered")
+        return report
+
+    server.load(fixture)
+    timings: List[float] = []
+    direct_link = None
+    with SoupCounter() as soup_counter:
+        for _ in range(repeat):
+            server.reset()
+            soup_counter.count = 0
+            session = replay_session(server)
+            start = time.perf_counter()
+            try:
+                direct_link = extractor_func(fixture["embed_url"], session=session)
+            except Exception as err:
+                report["problems"].append(f"extractor raised: {err}")
+                break
+            finally:
+                session.close()
+            timings.append(time.perf_counter() - start)
+
+    report.update(
+        wall_ms=statistics.median(timings) * 1000 if timings else None,
+        round_trips=server.round_trips,
+        bytes=server.bytes_sent,
+        soup_parses=soup_counter.count,
+    )
+    if server.unexpected:
+        report["problems"].append("unexpected requests: " + ", ".join(server.unexpected))
+    if direct_link is not None and not check_result(fixture, direct_link):
+        report["problems"].append(f"unexpected direct link: {direct_link}")
+    if server.round_trips > fixture.get("max_round_trips", server.round_trips):
+        report["problems"].append(
+            f"{server.round_trips} round-trips, budget is {fixture['max_round_trips']}"
+        )
+    if soup_counter.count > fixture.get("max_soup_parses", soup_counter.count):
+        report["problems"].append(
+            f"{soup_counter.count} BeautifulSoup parses, budget is {fixture['max_soup_parses']}"
+        )
+    report["ok"] = timings != [] and not report["problems"]
+    return report
+
+
+def load_fixtures(fixture_dir: str, providers: List[str]) -> List[Dict[str, Any]]:
+    fixtures = []
+    for path in sorted(glob.glob(os.path.join(fixture_dir, "*.json"))):
+        with open(path, encoding="utf-8") as handle:
+            fixture = json.load(handle)
+        if providers and fixture["provider"] not in providers:
+            continue
+        fixtures.append(fixture)
+    return fixtures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Replay recorded provider responses through every extractor."
+    )
+    parser.add_argument("providers", nargs="*", help="limit the run to these providers")
+    parser.add_argument("--fixtures", default=FIXTURE_DIR)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="print reports as JSON lines")
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args.fixtures, args.providers)
+    if not fixtures:
+        print("No fixtures found.")
+        sys.exit(1)
+
+    server = ReplayServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        reports = [run_fixture(server, fixture, args.repeat) for fixture in fixtures]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    if args.json:
+        for report in reports:
+            print(json.dumps(report))
+    else:
+        print(f"{'provider':12} {'result':6} {'wall ms':>8} {'trips':>5} {'bytes':>8} {'soup':>4}")
+        for report in reports:
+            wall_ms = report.get("wall_ms")
+            print(
+                f"{report['provider']:12} {'ok' if report['ok'] else 'FAIL':6} "
+                f"{wall_ms if wall_ms is not None else float('nan'):8.2f} "
+                f"{report.get('round_trips', 0):5d} {report.get('bytes', 0):8d} "
+                f"{report.get('soup_parses', 0):4d}"
+            )
+            for problem in report["problems"]:
+                print(f"    {problem}")
+
+    sys.exit(0 if all(report["ok"] for report in reports) else 1)
+
+
+if __name__ == "__main__":
+    main()
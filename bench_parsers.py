@@ -0,0 +1,81 @@
+import argparse
+import glob
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Dict, List, Tuple
+
+from parsers import LXML_AVAILABLE, SCANNERS, parse_providers
+
+
+BASE_URL = "https://aniworld.to"
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "parsers")
+
+
+def measure(html_content: str, backend: str, repeat: int) -> Tuple[float, int, Dict[str, Dict[int, str]]]:
+    timings: List[float] = []
+    result: Dict[str, Dict[int, str]] = {}
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = parse_providers(html_content, BASE_URL, backend=backend)
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    parse_providers(html_content, BASE_URL, backend=backend)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(timings), peak, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Compare provider parser backends on saved episode pages."
+    )
+    parser.add_argument(
+        "pages", nargs="*", help="saved aniworld episode HTML files (default: the pages in --fixtures)"
+    )
+    parser.add_argument("--fixtures", default=FIXTURE_DIR)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    pages = args.pages or sorted(glob.glob(os.path.join(args.fixtures, "*.html")))
+    if not pages:
+        print("No pages found.")
+        sys.exit(1)
+
+    backends = [name for name in SCANNERS if name != "lxml" or LXML_AVAILABLE]
+    mismatches = 0
+    totals = {backend: 0.0 for backend in backends}
+
+    print(f"{'page':40} {'backend':8} {'median ms':>10} {'py peak KiB':>12}")
+    for path in pages:
+        with open(path, encoding="utf-8", errors="replace") as handle:
+            html_content = handle.read()
+
+        expected = None
+        for backend in ["soup"] + [b for b in backends if b != "soup"]:
+            try:
+                median, peak, result = measure(html_content, backend, args.repeat)
+            except ValueError as err:
+                print(f"{path[-40:]:40} {backend:8} failed: {err}")
+                mismatches += 1
+                continue
+            totals[backend] += median
+            if expected is None:
+                expected = result
+            elif result != expected:
+                print(f"{path[-40:]:40} {backend:8} result differs from soup backend")
+                mismatches += 1
+            print(f"{path[-40:]:40} {backend:8} {median * 1000:10.3f} {peak / 1024:12.1f}")
+
+    print()
+    for backend in backends:
+        speedup = totals["soup"] / totals[backend] if totals[backend] else 0.0
+        print(f"{backend:8} total {totals[backend] * 1000:10.3f} ms  ({speedup:.1f}x vs soup)")
+
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Set, Tuple
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+IGNORED_TOP_LEVEL = {"site"}
+
+SCENARIOS: Dict[str, List[str]] = {
+    "cli-usage": ["downloader.py"],
+    "cli-help": ["downloader.py", "--help"],
+    "gui": ["-c", "import gui"],
+}
+BUDGETS_MS: Dict[str, float] = {
+    "cli-usage": 150.0,
+    "cli-help": 150.0,
+    "gui": 600.0,
+}
+FORBIDDEN_MODULES: Dict[str, Tuple[str, ...]] = {
+    "cli-usage": ("requests", "bs4", "lxml", "yt_dlp", "PyQt6", "sqlite3"),
+    "cli-help": ("requests", "bs4", "lxml", "yt_dlp", "PyQt6", "sqlite3"),
+    "gui": ("requests", "bs4", "lxml", "yt_dlp", "sqlite3"),
+}
+
+
+def parse_importtime(stderr: str) -> Tuple[float, Dict[str, float], Set[str]]:
+    total_us = 0.0
+    top_level: Dict[str, float] = {}
+    modules: Set[str] = set()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|", 2)
+        if not cumulative.strip().isdigit():
+            continue
+        module = name.strip()
+        modules.add(module)
+        if name.startswith("  ") or module in IGNORED_TOP_LEVEL:
+            continue
+        top_level[module] = top_level.get(module, 0.0) + int(cumulative) / 1000
+        total_us += int(cumulative)
+    return total_us / 1000, top_level, modules
+
+
+def measure(args: List[str], repeat: int) -> Tuple[float, Dict[str, float], Set[str]]:
+    totals: List[float] = []
+    top_level: Dict[str, float] = {}
+    modules: Set[str] = set()
+    for _ in range(repeat):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime"] + args,
+            cwd=HERE,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        total, top_level, modules = parse_importtime(proc.stderr)
+        totals.append(total)
+    return statistics.median(totals), top_level, modules
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Check the import time of the CLI and GUI entry points against budgets."
+    )
+    parser.add_argument("scenarios", nargs="*", help=f"scenarios to run (default: {', '.join(SCENARIOS)})")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--budget-scale",
+        type=float,
+        default=1.0,
+        help="multiply every time budget, e.g. 2.0 on slow machines",
+    )
+    parser.add_argument("--top", type=int, default=5, help="slowest top-level imports to show")
+    args = parser.parse_args()
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    failures = 0
+    print(f"{'scenario':10} {'median ms':>10} {'budget ms':>10}")
+    for name in args.scenarios or SCENARIOS:
+        median, top_level, modules = measure(SCENARIOS[name], args.repeat)
+        budget = BUDGETS_MS[name] * args.budget_scale
+        print(f"{name:10} {median:10.1f} {budget:10.1f}")
+        for module, elapsed in sorted(top_level.items(), key=lambda item: -item[1])[: args.top]:
+            print(f"{'':10} {elapsed:10.1f}   {module}")
+
+        if median > budget:
+            print(f"{name:10} exceeds its import time budget")
+            failures += 1
+        loaded = sorted(
+            forbidden
+            for forbidden in FORBIDDEN_MODULES[name]
+            if any(module == forbidden or module.startswith(forbidden + ".") for module in modules)
+        )
+        if loaded:
+            print(f"{name:10} imports deferred modules at start-up: {', '.join(loaded)}")
+            failures += 1
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "aniworld_downloader")
+DEFAULT_CACHE_PATH = os.path.join(DEFAULT_CACHE_DIR, "cache.sqlite3")
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_TTLS: Dict[str, float] = {
+    "providers": 6 * 3600,
+    "embed": 24 * 3600,
+    "direct": 30 * 60,
+}
+EXPIRY_SAFETY_MARGIN = 60
+EXPIRY_QUERY_KEYS = ("expiry", "expires", "exp")
+
+
+def _expiry_timestamp(direct_link: str) -> Optional[int]:
+    query = parse_qs(urlparse(direct_link).query)
+    for key in EXPIRY_QUERY_KEYS:
+        values = query.get(key)
+        if values and values[0].isdigit():
+            return int(values[0])
+    return None
+
+
+def direct_link_expiry(direct_link: str) -> Optional[float]:
+    timestamp = _expiry_timestamp(direct_link)
+    if timestamp is None or timestamp <= time.time():
+        return None
+    return float(timestamp)
+
+
+def direct_link_ttl(direct_link: str, default_ttl: float = DEFAULT_TTLS["direct"]) -> float:
+    timestamp = _expiry_timestamp(direct_link)
+    if timestamp is None:
+        return default_ttl
+    now = time.time()
+    if timestamp > now:
+        return max(0.0, min(default_ttl, timestamp - now - EXPIRY_SAFETY_MARGIN))
+    return max(0.0, timestamp + default_ttl - now)
+
+
+class ResolutionCache:
+    def __init__(
+        self,
+        path: str = DEFAULT_CACHE_PATH,
+        ttls: Optional[Dict[str, float]] = None,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+    ):
+        import sqlite3
+
+        self.path = path
+        self.ttls = dict(DEFAULT_TTLS)
+        self.ttls.update(ttls or {})
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "kind TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, last_access REAL NOT NULL, "
+                "PRIMARY KEY (kind, key))"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS entries_lru ON entries (kind, last_access)"
+            )
+
+    def get(self, kind: str, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM entries WHERE kind = ? AND key = ?",
+                (kind, key),
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._conn.execute(
+                    "DELETE FROM entries WHERE kind = ? AND key = ?", (kind, key)
+                )
+                return None
+            self._conn.execute(
+                "UPDATE entries SET last_access = ? WHERE kind = ? AND key = ?",
+                (now, kind, key),
+            )
+        return json.loads(row[0])
+
+    def set(self, kind: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttls.get(kind, 0) if ttl is None else ttl
+        if ttl <= 0:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (kind, key, value, expires_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (kind, key, json.dumps(value), now + ttl, now),
+            )
+            self._conn.execute(
+                "DELETE FROM entries WHERE kind = ? AND key IN ("
+                "SELECT key FROM entries WHERE kind = ? "
+                "ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (kind, kind, self.max_entries),
+            )
+
+    def invalidate(self, kind: str, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE kind = ? AND key = ?", (kind, key))
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM entries WHERE expires_at <= ?", (time.time(),)
+            )
+        return cursor.rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_cache: Optional[ResolutionCache] = None
+_cache_lock = threading.Lock()
+
+
+def configure_cache(
+    path: Optional[str] = DEFAULT_CACHE_PATH,
+    ttls: Optional[Dict[str, float]] = None,
+    max_entries: int = DEFAULT_MAX_ENTRIES,
+) -> Optional[ResolutionCache]:
+    global _cache
+    cache = ResolutionCache(path, ttls, max_entries) if path else None
+    with _cache_lock:
+        previous, _cache = _cache, cache
+    if previous is not None:
+        previous.close()
+    return cache
+
+
+def get_cache() -> Optional[ResolutionCache]:
+    return _cache
@@ -0,0 +1,459 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+
+from batch import SERIES_PATH_RE, episode_of, season_episode_links, season_of, series_season_links
+from cache import DEFAULT_CACHE_DIR, get_cache
+from downloader import DEFAULT_REQUEST_TIMEOUT, RANDOM_USER_AGENT, parse_providers_from_html
+from metrics import host_of, span
+from sessions import get_session
+
+
+DEFAULT_CATALOG_PATH = os.path.join(DEFAULT_CACHE_DIR, "catalog.sqlite3")
+DEFAULT_CRAWL_WORKERS = 4
+DEFAULT_RECHECK_AFTER = 24 * 3600.0
+LANGUAGE_NAMES: Dict[int, str] = {1: "German dub", 2: "English sub", 3: "German sub"}
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS pages ("
+    "url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, content_hash TEXT, "
+    "fetched_at REAL NOT NULL, checked_at REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS series (slug TEXT PRIMARY KEY, url TEXT NOT NULL, updated_at REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS seasons ("
+    "slug TEXT NOT NULL, season INTEGER NOT NULL, url TEXT NOT NULL, "
+    "PRIMARY KEY (slug, season))",
+    "CREATE TABLE IF NOT EXISTS episodes ("
+    "url TEXT PRIMARY KEY, slug TEXT NOT NULL, season INTEGER NOT NULL, episode INTEGER NOT NULL, "
+    "first_seen REAL NOT NULL, updated_at REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS episode_providers ("
+    "episode_url TEXT NOT NULL, provider TEXT NOT NULL, language_key INTEGER NOT NULL, "
+    "redirect_url TEXT NOT NULL, PRIMARY KEY (episode_url, provider, language_key))",
+    "CREATE INDEX IF NOT EXISTS episodes_series ON episodes (slug, season, episode)",
+    "CREATE INDEX IF NOT EXISTS providers_lookup ON episode_providers (provider, language_key)",
+)
+
+
+@dataclass
+class PageFetch:
+    url: str
+    changed: bool
+    text: Optional[str] = None
+    status_code: int = 0
+
+
+@dataclass
+class CrawlStats:
+    fetched: int = 0
+    not_modified: int = 0
+    unchanged: int = 0
+    parsed: int = 0
+    failed: int = 0
+    new_episodes: int = 0
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8", errors="replace")).hexdigest()
+
+
+def conditional_get(
+    url: str,
+    etag: Optional[str] = None,
+    last_modified: Optional[str] = None,
+    session: Optional[requests.Session] = None,
+) -> requests.Response:
+    session = session or get_session()
+    headers = {"User-Agent": RANDOM_USER_AGENT}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    with span("fetch", host=host_of(url), conditional=bool(etag or last_modified)) as current:
+        resp = session.get(url, headers=headers, timeout=DEFAULT_REQUEST_TIMEOUT)
+        current.set(status_code=resp.status_code, bytes=len(resp.content))
+        if resp.status_code != 304:
+            resp.raise_for_status()
+    return resp
+
+
+class Catalog:
+    def __init__(self, path: str = DEFAULT_CATALOG_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            for statement in SCHEMA:
+                self._conn.execute(statement)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def fetch(self, url: str, force: bool = False, session: Optional[requests.Session] = None) -> PageFetch:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, last_modified, content_hash FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+        etag, last_modified, previous_hash = row if row and not force else (None, None, None)
+        resp = conditional_get(url, etag, last_modified, session=session)
+        now = time.time()
+        if resp.status_code == 304:
+            with self._lock:
+                self._conn.execute("UPDATE pages SET checked_at = ? WHERE url = ?", (now, url))
+            return PageFetch(url, changed=False, status_code=304)
+
+        text = resp.text
+        digest = content_hash(text)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO pages (url, etag, last_modified, content_hash, fetched_at, checked_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (url) DO UPDATE SET "
+                "etag = excluded.etag, last_modified = excluded.last_modified, "
+                "content_hash = excluded.content_hash, fetched_at = excluded.fetched_at, "
+                "checked_at = excluded.checked_at",
+                (url, resp.headers.get("ETag"), resp.headers.get("Last-Modified"), digest, now, now),
+            )
+        return PageFetch(url, changed=digest != previous_hash, text=text, status_code=resp.status_code)
+
+    def forget_page(self, url: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM pages WHERE url = ?", (url,))
+
+    def seasons_of(self, slug: str) -> List[Tuple[int, str]]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT season, url FROM seasons WHERE slug = ? ORDER BY season", (slug,)
+            ).fetchall()
+
+    def stale_episodes(self, slug: str, season: int, max_age: float) -> List[str]:
+        with self._lock:
+            return [
+                row[0]
+                for row in self._conn.execute(
+                    "SELECT e.url FROM episodes e LEFT JOIN pages p ON p.url = e.url "
+                    "WHERE e.slug = ? AND e.season = ? AND (p.url IS NULL OR p.checked_at < ?) "
+                    "ORDER BY e.episode",
+                    (slug, season, time.time() - max_age),
+                )
+            ]
+
+    def store_series(self, slug: str, url: str, seasons: List[Tuple[int, str]]) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute(
+                "INSERT OR REPLACE INTO series (slug, url, updated_at) VALUES (?, ?, ?)", (slug, url, now)
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO seasons (slug, season, url) VALUES (?, ?, ?)",
+                [(slug, season, season_url) for season, season_url in seasons],
+            )
+            self._conn.execute("COMMIT")
+
+    def store_season(self, slug: str, season: int, episodes: List[Tuple[int, str]]) -> int:
+        now = time.time()
+        with self._lock:
+            known = {
+                row[0]
+                for row in self._conn.execute(
+                    "SELECT url FROM episodes WHERE slug = ? AND season = ?", (slug, season)
+                )
+            }
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT INTO episodes (url, slug, season, episode, first_seen, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (url) DO UPDATE SET episode = excluded.episode",
+                [(url, slug, season, episode, now, now) for episode, url in episodes],
+            )
+            self._conn.execute("COMMIT")
+        return sum(1 for _, url in episodes if url not in known)
+
+    def store_providers(self, episode_url: str, providers: Dict[str, Dict[int, str]]) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute("DELETE FROM episode_providers WHERE episode_url = ?", (episode_url,))
+            self._conn.executemany(
+                "INSERT INTO episode_providers (episode_url, provider, language_key, redirect_url) "
+                "VALUES (?, ?, ?, ?)",
+                [
+                    (episode_url, provider, int(lang_key), redirect_url)
+                    for provider, lang_map in providers.items()
+                    for lang_key, redirect_url in lang_map.items()
+                ],
+            )
+            self._conn.execute(
+                "UPDATE episodes SET updated_at = ? WHERE url = ?", (time.time(), episode_url)
+            )
+            self._conn.execute("COMMIT")
+
+    def providers_for(self, episode_url: str) -> Dict[str, Dict[int, str]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT provider, language_key, redirect_url FROM episode_providers WHERE episode_url = ?",
+                (episode_url,),
+            ).fetchall()
+        providers: Dict[str, Dict[int, str]] = {}
+        for provider, lang_key, redirect_url in rows:
+            providers.setdefault(provider, {})[lang_key] = redirect_url
+        return providers
+
+    def query(
+        self,
+        provider: Optional[str] = None,
+        language_key: Optional[int] = None,
+        slug: Optional[str] = None,
+        season: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        conditions: List[str] = []
+        params: List[Any] = []
+        if provider is not None:
+            conditions.append("p.provider = ?")
+            params.append(provider)
+        if language_key is not None:
+            conditions.append("p.language_key = ?")
+            params.append(language_key)
+        if slug is not None:
+            conditions.append("e.slug = ?")
+            params.append(slug)
+        if season is not None:
+            conditions.append("e.season = ?")
+            params.append(season)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT e.url, e.slug, e.season, e.episode, p.provider, p.language_key "
+                "FROM episodes e JOIN episode_providers p ON p.episode_url = e.url "
+                f"{where} ORDER BY e.slug, e.season, e.episode, p.provider, p.language_key",
+                params,
+            ).fetchall()
+
+        results: List[Dict[str, Any]] = []
+        by_url: Dict[str, Dict[str, Any]] = {}
+        for url, row_slug, row_season, episode, row_provider, lang_key in rows:
+            entry = by_url.get(url)
+            if entry is None:
+                entry = {"url": url, "slug": row_slug, "season": row_season, "episode": episode, "providers": {}}
+                by_url[url] = entry
+                results.append(entry)
+            entry["providers"].setdefault(row_provider, []).append(lang_key)
+        return results
+
+    def summary(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                table: self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in ("series", "seasons", "episodes", "episode_providers", "pages")
+            }
+
+
+class Crawler:
+    def __init__(
+        self,
+        catalog: Catalog,
+        workers: int = DEFAULT_CRAWL_WORKERS,
+        force: bool = False,
+        session: Optional[requests.Session] = None,
+        recheck_after: float = DEFAULT_RECHECK_AFTER,
+    ):
+        self.catalog = catalog
+        self.workers = workers
+        self.force = force
+        self.recheck_after = recheck_after
+        self.session = session
+        self.stats = CrawlStats()
+        self._stats_lock = threading.Lock()
+
+    def _count(self, fetch: Optional[PageFetch]) -> None:
+        with self._stats_lock:
+            if fetch is None:
+                self.stats.failed += 1
+            elif fetch.status_code == 304:
+                self.stats.not_modified += 1
+            else:
+                self.stats.fetched += 1
+                if not fetch.changed:
+                    self.stats.unchanged += 1
+
+    def _fetch(self, url: str) -> Optional[PageFetch]:
+        try:
+            fetch = self.catalog.fetch(url, force=self.force, session=self.session)
+        except requests.RequestException as err:
+            logging.warning(f"Could not fetch {url}: {err}")
+            fetch = None
+        self._count(fetch)
+        return fetch
+
+    def crawl(self, url: str) -> CrawlStats:
+        episode = episode_of(url)
+        if episode is not None:
+            slug, season, number = episode
+            self.catalog.store_season(slug, season, [(number, url)])
+            self._crawl_episodes([url])
+        elif season_of(url) is not None:
+            self.crawl_season(url)
+        elif SERIES_PATH_RE.search(urlparse(url).path):
+            self.crawl_series(url)
+        else:
+            raise ValueError(f"Not an aniworld series, season, film or episode URL: {url}")
+        return self.stats
+
+    def crawl_series(self, series_url: str) -> None:
+        slug = SERIES_PATH_RE.search(urlparse(series_url).path).group(1)
+        fetch = self._fetch(series_url)
+        if fetch is None:
+            return
+        if fetch.changed:
+            seasons = series_season_links(fetch.text, series_url)
+            self.catalog.store_series(slug, series_url, seasons)
+        else:
+            seasons = self.catalog.seasons_of(slug)
+        for _, season_url in seasons:
+            self.crawl_season(season_url)
+
+    def crawl_season(self, season_url: str) -> None:
+        slug, season = season_of(season_url)
+        fetch = self._fetch(season_url)
+        if fetch is None:
+            return
+        if fetch.changed:
+            episodes = season_episode_links(fetch.text, season_url)
+            new = self.catalog.store_season(slug, season, episodes)
+            with self._stats_lock:
+                self.stats.new_episodes += new
+            self._crawl_episodes([url for _, url in episodes])
+        else:
+            self._crawl_episodes(self.catalog.stale_episodes(slug, season, self.recheck_after))
+
+    def _crawl_episode(self, episode_url: str) -> None:
+        fetch = self._fetch(episode_url)
+        if fetch is None or not fetch.changed:
+            return
+        parsed = urlparse(episode_url)
+        try:
+            providers = parse_providers_from_html(fetch.text, f"{parsed.scheme}://{parsed.netloc}")
+        except ValueError as err:
+            logging.warning(f"Could not parse providers of {episode_url}: {err}")
+            self.catalog.forget_page(episode_url)
+            return
+        self.catalog.store_providers(episode_url, providers)
+        cache = get_cache()
+        if cache is not None:
+            cache.set("providers", episode_url, providers)
+        with self._stats_lock:
+            self.stats.parsed += 1
+
+    def _crawl_episodes(self, episode_urls: Iterable[str]) -> None:
+        episode_urls = list(episode_urls)
+        if not episode_urls:
+            return
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(episode_urls))) as pool:
+            list(pool.map(self._crawl_episode, episode_urls))
+
+
+def format_entry(entry: Dict[str, Any]) -> str:
+    providers = ", ".join(
+        f"{provider} ({'/'.join(LANGUAGE_NAMES.get(key, str(key)) for key in keys)})"
+        for provider, keys in sorted(entry["providers"].items())
+    )
+    return f"{entry['slug']} S{entry['season']:02d}E{entry['episode']:02d}  {entry['url']}  {providers}"
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="crawler.py",
+        description="Index aniworld series into a local catalog and query it.",
+    )
+    parser.add_argument("--catalog-path", default=DEFAULT_CATALOG_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    crawl = commands.add_parser("crawl", help="crawl series, season or episode URLs into the catalog")
+    crawl.add_argument("urls", nargs="+")
+    crawl.add_argument("--workers", type=int, default=DEFAULT_CRAWL_WORKERS)
+    crawl.add_argument(
+        "--force", action="store_true", help="ignore stored validators and hashes and refetch everything"
+    )
+    crawl.add_argument(
+        "--recheck-after",
+        type=float,
+        default=DEFAULT_RECHECK_AFTER / 3600,
+        help="hours after which known episode pages of unchanged seasons are checked again (default: 24)",
+    )
+
+    query = commands.add_parser("query", help="list indexed episodes")
+    query.add_argument("--provider", default=None, help="e.g. VOE")
+    query.add_argument(
+        "--language", type=int, default=None, help="data-lang-key: 1 German dub, 2 English sub, 3 German sub"
+    )
+    query.add_argument("--series", default=None, help="series slug")
+    query.add_argument("--season", type=int, default=None)
+    query.add_argument("--format", choices=["text", "urls", "json"], default="text")
+
+    commands.add_parser("stats", help="show the catalog size")
+    return parser
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    args = build_arg_parser().parse_args()
+    catalog = Catalog(args.catalog_path)
+
+    if args.command == "crawl":
+        from pipeline import configure_pipeline
+
+        configure_pipeline()
+        failed = False
+        for url in args.urls:
+            crawler = Crawler(
+                catalog, workers=args.workers, force=args.force, recheck_after=args.recheck_after * 3600
+            )
+            start = time.perf_counter()
+            try:
+                stats = crawler.crawl(url)
+            except ValueError as err:
+                print(f"{url}: {err}")
+                failed = True
+                continue
+            print(
+                f"{url}: {stats.fetched} fetched, {stats.not_modified} not modified, "
+                f"{stats.unchanged} unchanged, {stats.parsed} episodes parsed, "
+                f"{stats.new_episodes} new episodes, {stats.failed} failed "
+                f"in {time.perf_counter() - start:.1f}s"
+            )
+            failed = failed or stats.failed > 0
+        sys.exit(1 if failed else 0)
+
+    if args.command == "query":
+        start = time.perf_counter()
+        results = catalog.query(args.provider, args.language, args.series, args.season)
+        elapsed = time.perf_counter() - start
+        for entry in results:
+            if args.format == "json":
+                print(json.dumps(entry))
+            elif args.format == "urls":
+                print(entry["url"])
+            else:
+                print(format_entry(entry))
+        if args.format == "text":
+            print(f"{len(results)} episodes in {elapsed * 1000:.1f} ms")
+        return
+
+    for table, count in catalog.summary().items():
+        print(f"{table:18} {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,412 @@
+import argparse
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Deque, Dict, List, Optional
+
+from batch import enumerate_episodes, is_collection_url
+from cache import DEFAULT_CACHE_DIR
+from downloader import DEFAULT_NATIVE_CONNECTIONS, DEFAULT_PROBE_BYTES, DEFAULT_SELECT, DownloadCancelled
+from metrics import get_metrics
+from pipeline import BandwidthBudget, ProgressEvent, configure_pipeline, download_episode
+from tuning import DEFAULT_TUNING_PATH
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_QUEUE_PATH = os.path.join(DEFAULT_CACHE_DIR, "daemon_queue.json")
+DEFAULT_PARALLEL = 2
+MAX_FINISHED_JOBS = 200
+MAX_LOG_LINES = 200
+EVENT_INTERVAL = 0.25
+FINISHED_STATUSES = ("done", "failed", "cancelled")
+JOB_PATH_RE = re.compile(r"^/jobs/([0-9a-f]+)(/events|/cancel)?/?$")
+
+
+class JobCancelled(DownloadCancelled):
+    pass
+
+
+@dataclass
+class Job:
+    episode_url: str
+    output_dir: str
+    language_key: int = 3
+    select: str = DEFAULT_SELECT
+    engine: str = "yt-dlp"
+    id: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
+    status: str = "queued"
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    output_path: Optional[str] = None
+    error: Optional[str] = None
+    progress: Optional[Dict[str, Any]] = None
+    version: int = 0
+    log: Deque[str] = field(default_factory=lambda: deque(maxlen=MAX_LOG_LINES))
+    cancel_event: threading.Event = field(default_factory=threading.Event)
+
+    PERSISTED = ("episode_url", "output_dir", "language_key", "select", "engine", "id", "status",
+                 "created_at", "finished_at", "output_path", "error")
+
+    def to_dict(self, with_log: bool = False) -> Dict[str, Any]:
+        data = {name: getattr(self, name) for name in self.PERSISTED}
+        data["progress"] = self.progress
+        if with_log:
+            data["log"] = list(self.log)
+        return data
+
+
+class JobManager:
+    def __init__(
+        self,
+        output_dir: str,
+        queue_path: Optional[str] = DEFAULT_QUEUE_PATH,
+        parallel: int = DEFAULT_PARALLEL,
+        bandwidth: Optional[BandwidthBudget] = None,
+        connections: int = DEFAULT_NATIVE_CONNECTIONS,
+    ):
+        self.output_dir = output_dir
+        self.queue_path = queue_path
+        self.bandwidth = bandwidth or BandwidthBudget()
+        self.connections = connections
+        self.jobs: Dict[str, Job] = {}
+        self._changed = threading.Condition()
+        self._workers = [
+            threading.Thread(target=self._work, name=f"job-worker-{index}", daemon=True)
+            for index in range(parallel)
+        ]
+        self._load()
+
+    def start(self) -> None:
+        for worker in self._workers:
+            worker.start()
+
+    def _load(self) -> None:
+        if not self.queue_path:
+            return
+        try:
+            with open(self.queue_path, encoding="utf-8") as handle:
+                entries = json.load(handle)
+        except (OSError, ValueError):
+            return
+        for entry in entries:
+            job = Job(**{name: entry[name] for name in Job.PERSISTED if name in entry})
+            if job.status == "running":
+                job.status = "queued"
+            self.jobs[job.id] = job
+
+    def _save(self) -> None:
+        if not self.queue_path:
+            return
+        finished = [job for job in self.jobs.values() if job.status in FINISHED_STATUSES]
+        for job in sorted(finished, key=lambda job: job.finished_at or 0)[:-MAX_FINISHED_JOBS]:
+            del self.jobs[job.id]
+        entries = [job.to_dict() for job in self.jobs.values()]
+        try:
+            os.makedirs(os.path.dirname(self.queue_path), exist_ok=True)
+            tmp_path = f"{self.queue_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as handle:
+                json.dump(entries, handle, indent=2)
+            os.replace(tmp_path, self.queue_path)
+        except OSError as err:
+            logging.error(f"Failed to save job queue: {err}")
+
+    def _touch(self, job: Job, persist: bool = False) -> None:
+        with self._changed:
+            job.version += 1
+            if persist:
+                self._save()
+            self._changed.notify_all()
+
+    def submit(
+        self,
+        urls: List[str],
+        output_dir: Optional[str] = None,
+        language_key: int = 3,
+        select: str = DEFAULT_SELECT,
+        engine: str = "yt-dlp",
+    ) -> List[Job]:
+        episode_urls: List[str] = []
+        for url in urls:
+            episode_urls.extend(enumerate_episodes(url) if is_collection_url(url) else [url])
+        jobs = [
+            Job(episode_url, output_dir or self.output_dir, language_key, select, engine)
+            for episode_url in episode_urls
+        ]
+        with self._changed:
+            for job in jobs:
+                self.jobs[job.id] = job
+            self._save()
+            self._changed.notify_all()
+        return jobs
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        with self._changed:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            job.cancel_event.set()
+            if job.status == "queued":
+                job.status = "cancelled"
+                job.finished_at = time.time()
+            job.version += 1
+            self._save()
+            self._changed.notify_all()
+        return job
+
+    def list(self) -> List[Job]:
+        with self._changed:
+            return sorted(self.jobs.values(), key=lambda job: job.created_at)
+
+    def wait_for_change(self, job: Job, version: int, timeout: float) -> None:
+        with self._changed:
+            self._changed.wait_for(lambda: job.version != version, timeout)
+
+    def wait_until_idle(self) -> None:
+        with self._changed:
+            self._changed.wait_for(
+                lambda: all(job.status in FINISHED_STATUSES for job in self.jobs.values())
+            )
+
+    def _next_job(self) -> Job:
+        with self._changed:
+            while True:
+                queued = [job for job in self.jobs.values() if job.status == "queued"]
+                if queued:
+                    job = min(queued, key=lambda job: job.created_at)
+                    job.status = "running"
+                    job.version += 1
+                    self._save()
+                    self._changed.notify_all()
+                    return job
+                self._changed.wait()
+
+    def _work(self) -> None:
+        while True:
+            job = self._next_job()
+            self._run(job)
+
+    def _run(self, job: Job) -> None:
+        def _progress(event: ProgressEvent) -> None:
+            if job.cancel_event.is_set():
+                raise JobCancelled("Cancelled by client")
+            job.progress = asdict(event)
+            self._touch(job)
+
+        def _log(line: str) -> None:
+            job.log.append(line)
+
+        try:
+            job.output_path = download_episode(
+                job.episode_url,
+                job.output_dir,
+                language_key=job.language_key,
+                select=job.select,
+                probe_bytes=DEFAULT_PROBE_BYTES,
+                on_progress=_progress,
+                on_log=_log,
+                bandwidth=self.bandwidth,
+                engine=job.engine,
+                connections=self.connections,
+                cancel_event=job.cancel_event,
+            )
+            job.status = "done"
+        except Exception as err:
+            if job.cancel_event.is_set():
+                job.status = "cancelled"
+            else:
+                job.status = "failed"
+                job.error = str(err)
+                logging.error(f"Job {job.id} failed: {err}")
+        job.finished_at = time.time()
+        self._touch(job, persist=True)
+
+
+class DaemonServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, manager: JobManager):
+        super().__init__(address, DaemonHandler)
+        self.manager = manager
+
+
+class DaemonHandler(BaseHTTPRequestHandler):
+    server: DaemonServer
+
+    def _send_json(self, status: int, payload: Any) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        data = json.loads(self.rfile.read(length) or b"{}")
+        if not isinstance(data, dict):
+            raise ValueError("Request body must be a JSON object.")
+        return data
+
+    def _job(self, job_id: str) -> Optional[Job]:
+        job = self.server.manager.jobs.get(job_id)
+        if job is None:
+            self._send_json(404, {"error": f"Unknown job {job_id}"})
+        return job
+
+    def _stream_events(self, job: Job) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        version = -1
+        try:
+            while True:
+                if job.version != version:
+                    version = job.version
+                    self.wfile.write((json.dumps(job.to_dict()) + "\n").encode("utf-8"))
+                    self.wfile.flush()
+                if job.status in FINISHED_STATUSES:
+                    return
+                self.server.manager.wait_for_change(job, version, timeout=15)
+                time.sleep(EVENT_INTERVAL)
+        except (BrokenPipeError, ConnectionResetError):
+            return
+
+    def do_GET(self) -> None:
+        path = self.path.split("?", 1)[0]
+        if path in ("/jobs", "/jobs/"):
+            self._send_json(200, {"jobs": [job.to_dict() for job in self.server.manager.list()]})
+            return
+        if path == "/metrics":
+            body = get_metrics().registry.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        match = JOB_PATH_RE.match(path)
+        if not match or match.group(2) == "/cancel":
+            self._send_json(404, {"error": "Not found"})
+            return
+        job = self._job(match.group(1))
+        if job is None:
+            return
+        if match.group(2) == "/events":
+            self._stream_events(job)
+        else:
+            self._send_json(200, job.to_dict(with_log=True))
+
+    def do_POST(self) -> None:
+        path = self.path.split("?", 1)[0]
+        if path in ("/jobs", "/jobs/"):
+            try:
+                data = self._read_json()
+                urls = data.get("urls") or ([data["url"]] if data.get("url") else [])
+                if not urls:
+                    raise ValueError("Provide 'url' or 'urls'.")
+                jobs = self.server.manager.submit(
+                    urls,
+                    output_dir=data.get("output_dir"),
+                    language_key=int(data.get("language", 3)),
+                    select=data.get("select", DEFAULT_SELECT),
+                    engine=data.get("engine", "yt-dlp"),
+                )
+            except Exception as err:
+                self._send_json(400, {"error": str(err)})
+                return
+            self._send_json(201, {"jobs": [job.to_dict() for job in jobs]})
+            return
+        match = JOB_PATH_RE.match(path)
+        if match and match.group(2) == "/cancel":
+            self._cancel(match.group(1))
+            return
+        self._send_json(404, {"error": "Not found"})
+
+    def do_DELETE(self) -> None:
+        match = JOB_PATH_RE.match(self.path.split("?", 1)[0])
+        if not match or match.group(2):
+            self._send_json(404, {"error": "Not found"})
+            return
+        self._cancel(match.group(1))
+
+    def _cancel(self, job_id: str) -> None:
+        job = self.server.manager.cancel(job_id)
+        if job is None:
+            self._send_json(404, {"error": f"Unknown job {job_id}"})
+            return
+        self._send_json(200, job.to_dict())
+
+    def log_message(self, format: str, *args) -> None:
+        logging.debug(f"{self.address_string()} {format % args}")
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    parser = argparse.ArgumentParser(
+        prog="daemon.py",
+        description="Run the downloader as a local HTTP job service.",
+    )
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--output-dir", default=os.getcwd())
+    parser.add_argument("--parallel", type=int, default=DEFAULT_PARALLEL)
+    parser.add_argument(
+        "--bandwidth", type=int, default=0, help="total download limit in KiB/s (0 = unlimited)"
+    )
+    parser.add_argument("--connections", type=int, default=DEFAULT_NATIVE_CONNECTIONS)
+    parser.add_argument("--queue-path", default=DEFAULT_QUEUE_PATH)
+    parser.add_argument(
+        "--adaptive-fragments",
+        action="store_true",
+        help="learn fragment concurrency and rate limits per CDN host across jobs",
+    )
+    parser.add_argument("--tuning-path", default=None)
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="poll the series followed with watcher.py and queue their new episodes",
+    )
+    parser.add_argument("--watchlist-path", default=None)
+    args = parser.parse_args()
+
+    configure_pipeline(
+        tuning_path=(args.tuning_path or DEFAULT_TUNING_PATH) if args.adaptive_fragments else None
+    )
+    manager = JobManager(
+        args.output_dir,
+        queue_path=args.queue_path,
+        parallel=args.parallel,
+        bandwidth=BandwidthBudget(args.bandwidth * 1024),
+        connections=args.connections,
+    )
+    manager.start()
+    if args.watch:
+        from crawler import Catalog
+        from watcher import DEFAULT_WATCHLIST_PATH, Watcher
+
+        def _enqueue(urls: List[str], output_dir: Optional[str], language_key: int) -> None:
+            manager.submit(urls, output_dir=output_dir, language_key=language_key)
+
+        watcher = Watcher(Catalog(), _enqueue, path=args.watchlist_path or DEFAULT_WATCHLIST_PATH)
+        watcher.start(threading.Event())
+    server = DaemonServer((args.host, args.port), manager)
+    logging.info(f"Listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
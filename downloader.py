@@ -1,84 +1,57 @@
+import argparse
+import atexit
 import os
 import sys
 import logging
-import subprocess
-from typing import Dict, List, Tuple
-from urllib.parse import urljoin, urlparse
-
-import requests
-from bs4 import BeautifulSoup
-import base64
-import json
-import random
+import shutil
 import re
-import time
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+from urllib.parse import urljoin, urlparse
 
+from cache import DEFAULT_CACHE_PATH, get_cache
+from health import DEFAULT_HEALTH_PATH
+from metrics import TransferMeter, host_of, span
+from providers import INSECURE_PROVIDERS, PROVIDER_HEADERS, RANDOM_USER_AGENT
 
-DEFAULT_REQUEST_TIMEOUT = 30
-RANDOM_USER_AGENT = (
-    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
-    "(KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36"
-)
-
-LULUVDO_USER_AGENT = (
-    "Mozilla/5.0 (Android 15; Mobile; rv:132.0) Gecko/132.0 Firefox/132.0"
-)
-
-PROVIDER_HEADERS_D: Dict[str, List[str]] = {
-    "Vidmoly": ['Referer: "https://vidmoly.to"'],
-    "Doodstream": ['Referer: "https://dood.li/"'],
-    "VOE": [f"User-Agent: {RANDOM_USER_AGENT}"],
-    "LoadX": ["Accept: */*"],
-    "Filemoon": [
-        f"User-Agent: {RANDOM_USER_AGENT}",
-        'Referer: "https://filemoon.to"',
-    ],
-    "Luluvdo": [
-        f"User-Agent: {LULUVDO_USER_AGENT}",
-        "Accept-Language: de-DE,de;q=0.9,en-US;q=0.8,en;q=0.7",
-        'Origin: "https://luluvdo.com"',
-        'Referer: "https://luluvdo.com/"',
-    ],
-    "Vidoza": [],
-    "SpeedFiles": [],
-    "Streamtape": [],
-    "Hanime": [],
-}
+if TYPE_CHECKING:
+    import requests
 
 
-def sanitize_filename(filename: str) -> str:
-    invalid_chars = set('<>:"/\\|?*')
-    return "".join(ch for ch in filename if ch not in invalid_chars)
+DEFAULT_REQUEST_TIMEOUT = 30
+DEFAULT_PROBE_BYTES = 2 * 1024 * 1024
+SELECT_MODES = ("first", "fastest", "health")
+DEFAULT_SELECT = "health"
+DEFAULT_NATIVE_CONNECTIONS = 4
+DEFAULT_FRAGMENT_CONCURRENCY = 4
+DEFAULT_FRAGMENT_RETRIES = 10
+MAX_REDIRECTS = 10
+EXPIRED_STATUSES = (401, 403, 410)
+EXPIRED_MESSAGE_RE = re.compile(r"HTTP Error (?:401|403|410)\b|\bexpired\b", re.IGNORECASE)
+PARTIAL_SUFFIXES = (".part", ".ytdl", ".state.json", ".segments")
+PROVIDER_HEADERS_D: Dict[str, List[str]] = PROVIDER_HEADERS
 
 
-def parse_providers_from_html(html_content: str, base_url: str) -> Dict[str, Dict[int, str]]:
-    soup = BeautifulSoup(html_content, "html.parser")
-    providers: Dict[str, Dict[int, str]] = {}
+class LinkExpiredError(RuntimeError):
+    pass
 
-    episode_links = soup.find_all(
-        "li", class_=lambda x: x and x.startswith("episodeLink")
-    )
 
-    if not episode_links:
-        raise ValueError("No streaming providers found on the episode page.")
+class DownloadCancelled(Exception):
+    pass
 
-    for link in episode_links:
-        provider_tag = link.find("h4")
-        provider_name = provider_tag.get_text(strip=True) if provider_tag else None
 
-        anchor = link.find("a", class_="watchEpisode")
-        redirect_path = anchor.get("href") if anchor else None
-
-        lang_key_str = link.get("data-lang-key")
-        lang_key = int(lang_key_str) if lang_key_str and lang_key_str.isdigit() else None
+def sanitize_filename(filename: str) -> str:
+    invalid_chars = set('<>:"/\\|?*')
+    return "".join(ch for ch in filename if ch not in invalid_chars)
 
-        if provider_name and redirect_path and lang_key:
-            redirect_url = urljoin(base_url, redirect_path)
-            providers.setdefault(provider_name, {})[lang_key] = redirect_url
 
-    if not providers:
-        raise ValueError("Unable to extract providers from episode HTML.")
+def parse_providers_from_html(
+    html_content: str, base_url: str, backend: str = "auto"
+) -> Dict[str, Dict[int, str]]:
+    from parsers import parse_providers
 
+    with span("parse", host=host_of(base_url), backend=backend) as current:
+        providers = parse_providers(html_content, base_url, backend=backend)
+        current.set(providers=len(providers), html_bytes=len(html_content))
     return providers
 
 
@@ -95,33 +68,144 @@ def choose_provider(
     return provider_name, providers[provider_name][first_lang_key]
 
 
-def follow_redirect_to_embed(redirect_url: str) -> str:
-    resp = requests.get(
-        redirect_url,
-        headers={"User-Agent": RANDOM_USER_AGENT},
-        timeout=DEFAULT_REQUEST_TIMEOUT,
-        allow_redirects=True,
-    )
-    resp.raise_for_status()
-    return resp.url
+def site_of(url: str) -> str:
+    host = host_of(url)
+    if not host or host.replace(".", "").isdigit() or ":" in host:
+        return host
+    return ".".join(host.split(".")[-2:])
+
+
+def follow_redirect_to_embed(
+    redirect_url: str, session: Optional["requests.Session"] = None
+) -> str:
+    from sessions import get_session
+
+    cache = get_cache()
+    if cache is not None:
+        cached = cache.get("embed", redirect_url)
+        if cached:
+            return cached
+
+    session = session or get_session()
+    url = redirect_url
+    site = site_of(redirect_url)
+    with span("redirect", host=host_of(redirect_url)) as current:
+        hops = 0
+        while True:
+            resp = session.get(
+                url,
+                headers={"User-Agent": RANDOM_USER_AGENT},
+                timeout=DEFAULT_REQUEST_TIMEOUT,
+                allow_redirects=False,
+            )
+            location = resp.headers.get("Location")
+            if not resp.is_redirect or not location:
+                resp.raise_for_status()
+                break
+            url = urljoin(url, location)
+            hops += 1
+            if site_of(url) != site:
+                break
+            if hops > MAX_REDIRECTS:
+                raise RuntimeError(f"Too many redirects for {redirect_url}")
+        current.set(hops=hops, embed_host=host_of(url))
+
+    if cache is not None:
+        cache.set("embed", redirect_url, url)
+    return url
+
+
+def expand_redirects(
+    providers: Dict[str, Dict[int, str]], max_workers: int = 8
+) -> Dict[str, Dict[int, str]]:
+    jobs = [
+        (name, lang_key, redirect_url)
+        for name, lang_map in providers.items()
+        for lang_key, redirect_url in lang_map.items()
+    ]
+    embeds: Dict[str, Dict[int, str]] = {}
+    if not jobs:
+        return embeds
+
+    import contextvars
+    import requests
+    from concurrent.futures import ThreadPoolExecutor
+
+    def _expand(job: Tuple[str, int, str]) -> Optional[str]:
+        try:
+            return follow_redirect_to_embed(job[2])
+        except (requests.RequestException, RuntimeError) as err:
+            logging.warning(f"Could not follow redirect for {job[0]}: {err}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(jobs))) as pool:
+        futures = [pool.submit(contextvars.copy_context().run, _expand, job) for job in jobs]
+        for (name, lang_key, _), future in zip(jobs, futures):
+            embed_url = future.result()
+            if embed_url:
+                embeds.setdefault(name, {})[lang_key] = embed_url
+    return embeds
+
+
+def fetch_page(url: str, session: Optional["requests.Session"] = None) -> "requests.Response":
+    from sessions import get_session
+
+    session = session or get_session()
+    with span("fetch", host=host_of(url)) as current:
+        resp = session.get(
+            url,
+            headers={"User-Agent": RANDOM_USER_AGENT},
+            timeout=DEFAULT_REQUEST_TIMEOUT,
+        )
+        current.set(status_code=resp.status_code, bytes=len(resp.content))
+        resp.raise_for_status()
+    return resp
+
+
+def fetch_providers(
+    episode_url: str, session: Optional["requests.Session"] = None
+) -> Dict[str, Dict[int, str]]:
+    cache = get_cache()
+    if cache is not None:
+        cached = cache.get("providers", episode_url)
+        if cached:
+            return {
+                name: {int(lang_key): url for lang_key, url in lang_map.items()}
+                for name, lang_map in cached.items()
+            }
+
+    resp = fetch_page(episode_url, session=session)
+    parsed = urlparse(episode_url)
+    base_url = f"{parsed.scheme}://{parsed.netloc}"
+    providers = parse_providers_from_html(resp.text, base_url)
+    if cache is not None:
+        cache.set("providers", episode_url, providers)
+    return providers
 
 
-def build_ytdl_command(
-    direct_link: str, output_path: str, provider: str
-) -> List[str]:
+def invalidate_episode(episode_url: str) -> None:
+    cache = get_cache()
+    if cache is not None:
+        cache.invalidate("providers", episode_url)
+
+
+def build_ytdl_command(direct_link: str, output_path: str, provider: str) -> List[str]:
     cmd: List[str] = [
         "yt-dlp",
         direct_link,
         "--fragment-retries",
-        "infinite",
+        str(DEFAULT_FRAGMENT_RETRIES),
+        "--abort-on-unavailable-fragments",
         "--concurrent-fragments",
-        "4",
+        str(DEFAULT_FRAGMENT_CONCURRENCY),
         "-o",
         output_path,
         "--quiet",
         "--no-warnings",
         "--progress",
     ]
+    if provider in INSECURE_PROVIDERS:
+        cmd.append("--no-check-certificates")
 
     for header in PROVIDER_HEADERS_D.get(provider, []):
         cmd.extend(["--add-header", header])
@@ -130,10 +214,79 @@ def build_ytdl_command(
 
 
 def run_download(cmd: List[str]) -> None:
-    try:
-        subprocess.run(cmd, check=True)
-    except subprocess.CalledProcessError as exc:
-        raise RuntimeError(f"yt-dlp failed with exit code {exc.returncode}") from exc
+    import subprocess
+
+    process = subprocess.Popen(cmd, stderr=subprocess.PIPE)
+    tail = b""
+    for chunk in iter(lambda: process.stderr.read1(4096), b""):
+        sys.stderr.buffer.write(chunk)
+        sys.stderr.flush()
+        tail = (tail + chunk)[-8192:]
+    returncode = process.wait()
+    if returncode:
+        if EXPIRED_MESSAGE_RE.search(tail.decode("utf-8", errors="replace")):
+            raise LinkExpiredError(f"yt-dlp failed with exit code {returncode}: direct link rejected")
+        raise RuntimeError(f"yt-dlp failed with exit code {returncode}")
+
+
+def discard_partial_download(output_path: str) -> None:
+    directory = os.path.dirname(output_path) or "."
+    prefix = os.path.basename(output_path)
+    for name in os.listdir(directory):
+        if name.startswith(prefix) and name[len(prefix):].startswith(PARTIAL_SUFFIXES):
+            path = os.path.join(directory, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+
+
+def download_resolution(
+    direct_link: str,
+    output_path: str,
+    provider: str,
+    engine: str = "yt-dlp",
+    connections: int = DEFAULT_NATIVE_CONNECTIONS,
+) -> None:
+    meter = TransferMeter()
+    with span("download", provider=provider, host=host_of(direct_link), engine=engine) as current:
+        try:
+            _download_resolution(direct_link, output_path, provider, engine, connections, meter)
+        finally:
+            meter.apply(current)
+            if os.path.exists(output_path):
+                current.set(bytes=os.path.getsize(output_path))
+
+
+def _download_resolution(
+    direct_link: str,
+    output_path: str,
+    provider: str,
+    engine: str,
+    connections: int,
+    meter: TransferMeter,
+) -> None:
+    if engine == "native":
+        from segmented import UnsupportedStreamError, download_native
+
+        try:
+            download_native(
+                direct_link, output_path, provider, connections, on_progress=meter.on_progress
+            )
+            return
+        except UnsupportedStreamError as err:
+            logging.info(f"Native engine cannot handle this stream ({err}), using yt-dlp")
+
+    from tuning import get_tuner
+
+    if get_tuner() is not None:
+        from pipeline import run_download_inprocess
+
+        run_download_inprocess(
+            direct_link, output_path, provider, on_progress=meter.on_progress, on_log=logging.info
+        )
+        return
+    run_download(build_ytdl_command(direct_link, output_path, provider))
 
 
 def derive_output_filename(episode_url: str) -> str:
@@ -143,90 +296,247 @@ def derive_output_filename(episode_url: str) -> str:
         slug = parts[-3]
         season_part = parts[-2]
         episode_part = parts[-1]
+        title = sanitize_filename(slug)
+        if season_part == "filme":
+            return f"{title}_Film{int(episode_part.split('-')[1]):02d}.mp4"
         season = int(season_part.split("-")[1])
         episode = int(episode_part.split("-")[1])
-        title = sanitize_filename(slug)
         return f"{title}_S{season:02d}E{episode:02d}.mp4"
     except Exception:
         return sanitize_filename(os.path.basename(episode_url.rstrip("/"))) + ".mp4"
 
 
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="downloader.py",
+        description="Download a single aniworld.to episode.",
+    )
+    parser.add_argument("episode_url")
+    parser.add_argument(
+        "--language",
+        type=int,
+        default=3,
+        help="aniworld data-lang-key to prefer (default: 3)",
+    )
+    parser.add_argument(
+        "--select",
+        choices=SELECT_MODES,
+        default=DEFAULT_SELECT,
+        help=(
+            "use the first working provider, probe all and pick the fastest, or pick the one "
+            "with the lowest expected time to complete from past runs"
+        ),
+    )
+    parser.add_argument(
+        "--probe-bytes",
+        type=int,
+        default=DEFAULT_PROBE_BYTES,
+        help="bytes to fetch per provider when probing throughput",
+    )
+    parser.add_argument(
+        "--output-dir",
+        default=None,
+        help="directory to download into (default: current directory)",
+    )
+    parser.add_argument(
+        "--resolve-workers",
+        type=int,
+        default=4,
+        help="episodes resolved concurrently in batch mode",
+    )
+    parser.add_argument(
+        "--download-workers",
+        type=int,
+        default=2,
+        help="downloads running concurrently in batch mode",
+    )
+    parser.add_argument(
+        "--pipelined",
+        action="store_true",
+        help="in batch mode download one episode at a time and resolve the next one meanwhile",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=["yt-dlp", "native"],
+        default="yt-dlp",
+        help="download with yt-dlp or the built-in segmented downloader",
+    )
+    parser.add_argument(
+        "--connections",
+        type=int,
+        default=DEFAULT_NATIVE_CONNECTIONS,
+        help="parallel connections per download for the native engine",
+    )
+    parser.add_argument(
+        "--cache-path",
+        default=DEFAULT_CACHE_PATH,
+        help="SQLite file caching providers, embed URLs and direct links",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="always resolve from scratch without the resolution cache",
+    )
+    parser.add_argument(
+        "--health-path",
+        default=DEFAULT_HEALTH_PATH,
+        help="JSON file with decayed per-provider and per-host success and speed statistics",
+    )
+    parser.add_argument(
+        "--trace-file",
+        default=None,
+        help="append a JSON line with timings for every pipeline stage to this file",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        default=None,
+        help="write Prometheus-style stage counters and histograms to this file on exit",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="profile CPU time and allocations of every pipeline stage",
+    )
+    parser.add_argument(
+        "--profile-dir",
+        default=None,
+        help="directory for profile snapshots (default: ~/.cache/aniworld_downloader/profiles)",
+    )
+    parser.add_argument(
+        "--adaptive-fragments",
+        action="store_true",
+        help="learn fragment concurrency and rate limits per CDN host across runs",
+    )
+    parser.add_argument(
+        "--tuning-path",
+        default=None,
+        help="JSON file storing the learned per-host fragment settings",
+    )
+    parser.add_argument(
+        "--resolve-only",
+        action="store_true",
+        help=(
+            "resolve direct links without downloading; episode_url may also be a file of URLs "
+            "or - for stdin, and --resolve-workers episodes are resolved concurrently"
+        ),
+    )
+    parser.add_argument(
+        "--manifest",
+        default="-",
+        help="JSON lines file written by --resolve-only (default: stdout)",
+    )
+    return parser
+
+
+def _write_profile() -> None:
+    from profiling import stop_profiling
+
+    summary_path = stop_profiling()
+    if summary_path:
+        print(f"Profile written to {os.path.dirname(summary_path)}")
+        with open(summary_path, encoding="utf-8") as handle:
+            print(handle.read())
+
+
 def main() -> None:
     logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
-    if len(sys.argv) != 2:
-        print("Usage: python downloader.py <episode_url>")
-        sys.exit(1)
+    args = build_arg_parser().parse_args()
+
+    from metrics import configure_metrics
+    from pipeline import configure_pipeline
+    from profiling import DEFAULT_PROFILE_DIR, configure_profiling
+    from tuning import DEFAULT_TUNING_PATH
+
+    metrics = configure_metrics(args.trace_file)
+    if args.metrics_file:
+        atexit.register(metrics.write_prometheus, args.metrics_file)
+    if args.profile:
+        configure_profiling(args.profile_dir or DEFAULT_PROFILE_DIR)
+        atexit.register(_write_profile)
+
+    configure_pipeline(
+        None if args.no_cache else args.cache_path,
+        (args.tuning_path or DEFAULT_TUNING_PATH) if args.adaptive_fragments else None,
+        args.health_path,
+    )
 
-    episode_url = sys.argv[1]
-    logging.info(f"Fetching episode page: {episode_url}")
-    try:
-        resp = requests.get(
+    episode_url = args.episode_url
+    output_dir = args.output_dir or os.getcwd()
+
+    if args.resolve_only:
+        from manifest import run_manifest
+
+        failures = run_manifest(
             episode_url,
-            headers={"User-Agent": RANDOM_USER_AGENT},
-            timeout=DEFAULT_REQUEST_TIMEOUT,
+            args.manifest,
+            language_key=args.language,
+            select=args.select,
+            probe_bytes=args.probe_bytes,
+            workers=args.resolve_workers,
         )
-        resp.raise_for_status()
-    except requests.RequestException as err:
-        print(f"Error fetching episode URL: {err}")
-        sys.exit(1)
+        sys.exit(1 if failures else 0)
 
-    parsed = urlparse(episode_url)
-    base_url = f"{parsed.scheme}://{parsed.netloc}"
+    import requests
+    from batch import is_collection_url, run_batch
 
-    try:
-        providers = parse_providers_from_html(resp.text, base_url)
-    except Exception as err:
-        print(f"Error parsing providers: {err}")
-        sys.exit(1)
-
-    provider_name, redirect_url = choose_provider(providers)
-    logging.info(f"Selected provider: {provider_name} (redirect: {redirect_url})")
+    if is_collection_url(episode_url):
+        failures = run_batch(
+            episode_url,
+            output_dir,
+            language_key=args.language,
+            select=args.select,
+            probe_bytes=args.probe_bytes,
+            resolve_workers=args.resolve_workers,
+            download_workers=args.download_workers,
+            engine=args.engine,
+            connections=args.connections,
+            pipelined=args.pipelined,
+        )
+        sys.exit(1 if failures else 0)
 
+    logging.info(f"Fetching episode page: {episode_url}")
     try:
-        embed_url = follow_redirect_to_embed(redirect_url)
-    except Exception as err:
-        print(f"Error obtaining embed URL: {err}")
+        providers = fetch_providers(episode_url)
+    except requests.RequestException as err:
+        print(f"Error fetching episode URL: {err}")
         sys.exit(1)
-
-    logging.info(f"Embed URL: {embed_url}")
-
-    extractor_map = {
-        "Vidoza": "extractors.get_direct_link_from_vidoza",
-        "LoadX": "extractors.get_direct_link_from_loadx",
-        "Luluvdo": "extractors.get_direct_link_from_luluvdo",
-        "Filemoon": "extractors.get_direct_link_from_filemoon",
-        "Doodstream": "extractors.get_direct_link_from_doodstream",
-        "VOE": "extractors.get_direct_link_from_voe",
-        "Vidmoly": "extractors.get_direct_link_from_vidmoly",
-        "SpeedFiles": "extractors.get_direct_link_from_speedfiles",
-    }
-
-    if provider_name not in extractor_map:
-        print(f"Provider '{provider_name}' is not supported.")
+    except Exception as err:
+        print(f"Error parsing providers: {err}")
         sys.exit(1)
 
-    extractor_func = None
-    import importlib
-    extractors = importlib.import_module("extractors")
-    extractor_func = getattr(extractors, extractor_map[provider_name].split('.')[-1])
+    from resolver import download_with_refresh, invalidate_resolution, select_resolution
 
     try:
-        direct_link = extractor_func(embed_url)
+        resolution = select_resolution(
+            providers, args.language, select=args.select, probe_bytes=args.probe_bytes
+        )
     except Exception as err:
-        print(f"Error extracting direct link from provider '{provider_name}': {err}")
+        invalidate_episode(episode_url)
+        print(f"Error resolving direct link: {err}")
         sys.exit(1)
 
+    provider_name = resolution.provider
+    direct_link = resolution.direct_link
+    logging.info(f"Selected provider: {provider_name} (redirect: {resolution.redirect_url})")
+    logging.info(f"Embed URL: {resolution.embed_url}")
     logging.info(f"Direct video URL: {direct_link}")
 
     filename = derive_output_filename(episode_url)
-    output_path = os.path.join(os.getcwd(), filename)
+    output_path = os.path.join(output_dir, filename)
     logging.info(f"Downloading to {output_path}")
 
-    cmd = build_ytdl_command(direct_link, output_path, provider_name)
     try:
-        run_download(cmd)
+        download_with_refresh(
+            resolution,
+            output_path,
+            lambda current: download_resolution(
+                current.direct_link, output_path, current.provider, args.engine, args.connections
+            ),
+            episode_url,
+        )
         print(f"Download completed: {output_path}")
     except Exception as err:
+        invalidate_resolution(resolution)
         print(f"Download failed: {err}")
         sys.exit(1)
 
@@ -4,23 +4,25 @@ import re
 import requests
 import random
 import time
-from bs4 import BeautifulSoup
+from typing import Optional
 from urllib.parse import urljoin, urlparse
 
+from providers import LULUVDO_USER_AGENT, PROVIDERS, RANDOM_USER_AGENT
+from sessions import get_session
+
 
 DEFAULT_REQUEST_TIMEOUT = 30
-RANDOM_USER_AGENT = (
-    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
-    "(KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36"
-)
-LULUVDO_USER_AGENT = (
-    "Mozilla/5.0 (Android 15; Mobile; rv:132.0) Gecko/132.0 Firefox/132.0"
-)
 
 
-def get_direct_link_from_vidoza(embeded_vidoza_link: str) -> str:
+def get_direct_link_from_vidoza(
+    embeded_vidoza_link: str, session: Optional[requests.Session] = None
+) -> str:
+    from bs4 import BeautifulSoup
+
+    session = session or get_session("Vidoza")
+    patterns = PROVIDERS["Vidoza"].patterns
     try:
-        resp = requests.get(
+        resp = session.get(
             embeded_vidoza_link,
             headers={"User-Agent": RANDOM_USER_AGENT},
             timeout=DEFAULT_REQUEST_TIMEOUT,
@@ -30,23 +32,29 @@ def get_direct_link_from_vidoza(embeded_vidoza_link: str) -> str:
         raise ValueError(f"Failed to fetch Vidoza page: {err}") from err
 
     html_content = resp.text
-    match = re.search(r'sourcesCode:\s*"([^"]+)"', html_content)
+    match = patterns["source"].search(html_content)
     if match:
         return match.group(1)
 
     soup = BeautifulSoup(html_content, "html.parser")
     for script in soup.find_all("script", string=True):
         if script.string and "sourcesCode:" in script.string:
-            match = re.search(r'sourcesCode:\s*"([^"]+)"', script.string)
+            match = patterns["source"].search(script.string)
             if match:
                 return match.group(1)
 
     raise ValueError("No direct link found in Vidoza page.")
 
 
-def get_direct_link_from_vidmoly(embeded_vidmoly_link: str) -> str:
+def get_direct_link_from_vidmoly(
+    embeded_vidmoly_link: str, session: Optional[requests.Session] = None
+) -> str:
+    from bs4 import BeautifulSoup
+
+    session = session or get_session("Vidmoly")
+    patterns = PROVIDERS["Vidmoly"].patterns
     try:
-        resp = requests.get(
+        resp = session.get(
             embeded_vidmoly_link,
             headers={"User-Agent": RANDOM_USER_AGENT},
             timeout=DEFAULT_REQUEST_TIMEOUT,
@@ -56,21 +64,24 @@ def get_direct_link_from_vidmoly(embeded_vidmoly_link: str) -> str:
         raise ValueError(f"Failed to fetch Vidmoly page: {err}") from err
 
     html = resp.text
-    match = re.search(r'file:\s*"(https?://[^\"]+)"', html)
+    match = patterns["file"].search(html)
     if match:
         return match.group(1)
 
     soup = BeautifulSoup(html, "html.parser")
     for script in soup.find_all("script", string=True):
         if script.string:
-            match = re.search(r'file:\s*"(https?://[^\"]+)"', script.string)
+            match = patterns["file"].search(script.string)
             if match:
                 return match.group(1)
 
     raise ValueError("No direct link found in Vidmoly page.")
 
 
-def get_direct_link_from_loadx(embeded_loadx_link: str) -> str:
+def get_direct_link_from_loadx(
+    embeded_loadx_link: str, session: Optional[requests.Session] = None
+) -> str:
+    session = session or get_session("LoadX")
     def _validate_loadx_url(url: str) -> str:
         if not url or not url.strip():
             raise ValueError("LoadX URL cannot be empty")
@@ -85,7 +96,7 @@ def get_direct_link_from_loadx(embeded_loadx_link: str) -> str:
     def _make_request(url: str, method: str = "GET", headers=None, allow_redirects=True):
         try:
             if method.upper() == "HEAD":
-                response = requests.head(
+                response = session.head(
                     url,
                     allow_redirects=allow_redirects,
                     verify=False,
@@ -93,14 +104,14 @@ def get_direct_link_from_loadx(embeded_loadx_link: str) -> str:
                     headers=headers or {},
                 )
             elif method.upper() == "POST":
-                response = requests.post(
+                response = session.post(
                     url,
                     headers=headers or {},
                     verify=False,
                     timeout=DEFAULT_REQUEST_TIMEOUT,
                 )
             else:
-                response = requests.get(
+                response = session.get(
                     url,
                     headers=headers or {},
                     verify=False,
@@ -140,7 +151,12 @@ def get_direct_link_from_loadx(embeded_loadx_link: str) -> str:
     return _parse_video_response(api_resp.text)
 
 
-def get_direct_link_from_luluvdo(embeded_luluvdo_link: str) -> str:
+def get_direct_link_from_luluvdo(
+    embeded_luluvdo_link: str, session: Optional[requests.Session] = None
+) -> str:
+    session = session or get_session("Luluvdo")
+    patterns = PROVIDERS["Luluvdo"].patterns
+
     def _validate_luluvdo_url(url: str) -> str:
         if not url or not url.strip():
             raise ValueError("LuluVDO URL cannot be empty")
@@ -170,7 +186,7 @@ def get_direct_link_from_luluvdo(embeded_luluvdo_link: str) -> str:
 
     def _make_request(url: str, headers: dict) -> requests.Response:
         try:
-            resp = requests.get(
+            resp = session.get(
                 url,
                 headers=headers,
                 timeout=DEFAULT_REQUEST_TIMEOUT,
@@ -181,7 +197,7 @@ def get_direct_link_from_luluvdo(embeded_luluvdo_link: str) -> str:
             raise ValueError(f"Failed to fetch URL: {err}") from err
 
     def _extract_video_url(text: str) -> str:
-        match = re.search(r'file:\s*"([^"]+)"', text)
+        match = patterns["file"].search(text)
         if not match:
             raise ValueError("No video URL found in response")
         return match.group(1).strip()
@@ -198,7 +214,13 @@ def get_direct_link_from_luluvdo(embeded_luluvdo_link: str) -> str:
     return _extract_video_url(resp.text)
 
 
-def get_direct_link_from_filemoon(embeded_filemoon_link: str) -> str:
+def get_direct_link_from_filemoon(
+    embeded_filemoon_link: str, session: Optional[requests.Session] = None
+) -> str:
+    from bs4 import BeautifulSoup
+
+    session = session or get_session("Filemoon")
+    patterns = PROVIDERS["Filemoon"].patterns
     if not embeded_filemoon_link:
         raise ValueError("Embed URL cannot be empty")
 
@@ -206,7 +228,7 @@ def get_direct_link_from_filemoon(embeded_filemoon_link: str) -> str:
 
     def _make_request(url: str, headers=None):
         try:
-            resp = requests.get(
+            resp = session.get(
                 url,
                 headers=headers,
                 timeout=DEFAULT_REQUEST_TIMEOUT,
@@ -229,13 +251,17 @@ def get_direct_link_from_filemoon(embeded_filemoon_link: str) -> str:
     }
     iframe_resp = _make_request(iframe_url, headers=headers)
     content = iframe_resp.text
-    match = re.search(r'file:\s*"([^"]+)"', content)
+    match = patterns["file"].search(content)
     if not match:
         raise ValueError("No file URL found in Filemoon iframe")
     return match.group(1).strip()
 
 
-def get_direct_link_from_doodstream(embeded_doodstream_link: str) -> str:
+def get_direct_link_from_doodstream(
+    embeded_doodstream_link: str, session: Optional[requests.Session] = None
+) -> str:
+    session = session or get_session("Doodstream")
+    patterns = PROVIDERS["Doodstream"].patterns
     if not embeded_doodstream_link:
         raise ValueError("Embed URL cannot be empty")
 
@@ -247,7 +273,7 @@ def get_direct_link_from_doodstream(embeded_doodstream_link: str) -> str:
 
     def _make_request(url: str, headers: dict):
         try:
-            resp = requests.get(
+            resp = session.get(
                 url,
                 headers=headers,
                 timeout=DEFAULT_REQUEST_TIMEOUT,
@@ -258,8 +284,8 @@ def get_direct_link_from_doodstream(embeded_doodstream_link: str) -> str:
         except requests.RequestException as err:
             raise ValueError(f"Request failed for {url}: {err}") from err
 
-    def _extract_data(pattern: str, content: str):
-        match = re.search(pattern, content)
+    def _extract_data(pattern: re.Pattern, content: str):
+        match = pattern.search(content)
         return match.group(1) if match else None
 
     def _generate_random_string(length: int = 10) -> str:
@@ -270,14 +296,12 @@ def get_direct_link_from_doodstream(embeded_doodstream_link: str) -> str:
     resp = _make_request(embeded_doodstream_link, headers)
     text = resp.text
 
-    pass_md5_pattern = r"\$\.get\('([^']*\/pass_md5\/[^']*)'"
-    token_pattern = r"token=([a-zA-Z0-9]+)"
-    pass_md5_url = _extract_data(pass_md5_pattern, text)
+    pass_md5_url = _extract_data(patterns["pass_md5"], text)
     if not pass_md5_url:
         raise ValueError("pass_md5 URL not found in Doodstream page")
     if not pass_md5_url.startswith("http"):
         pass_md5_url = urljoin("https://dood.li", pass_md5_url)
-    token = _extract_data(token_pattern, text)
+    token = _extract_data(patterns["token"], text)
     if not token:
         raise ValueError("Token not found in Doodstream page")
 
@@ -291,7 +315,14 @@ def get_direct_link_from_doodstream(embeded_doodstream_link: str) -> str:
     return f"{base_url}{random_str}?token={token}&expiry={expiry}"
 
 
-def get_direct_link_from_voe(embeded_voe_link: str) -> str:
+def get_direct_link_from_voe(
+    embeded_voe_link: str, session: Optional[requests.Session] = None
+) -> str:
+    from bs4 import BeautifulSoup
+
+    session = session or get_session("VOE")
+    patterns = PROVIDERS["VOE"].patterns
+
     def shift_letters(input_str: str) -> str:
         result = []
         for c in input_str:
@@ -324,7 +355,7 @@ def get_direct_link_from_voe(embeded_voe_link: str) -> str:
             raise ValueError(f"Failed to decode VOE string: {err}") from err
 
     try:
-        resp = requests.get(
+        resp = session.get(
             embeded_voe_link,
             headers={"User-Agent": RANDOM_USER_AGENT},
             timeout=DEFAULT_REQUEST_TIMEOUT,
@@ -333,13 +364,13 @@ def get_direct_link_from_voe(embeded_voe_link: str) -> str:
     except requests.RequestException as err:
         raise ValueError(f"Failed to fetch VOE page: {err}") from err
 
-    match = re.search(r"https?://[^'\"<>]+", resp.text)
+    match = patterns["redirect"].search(resp.text)
     if not match:
         raise ValueError("No redirect URL found in VOE response.")
     redirect_url = match.group(0)
 
     try:
-        with requests.get(
+        with session.get(
             redirect_url,
             headers={"User-Agent": RANDOM_USER_AGENT},
             timeout=DEFAULT_REQUEST_TIMEOUT,
@@ -360,7 +391,7 @@ def get_direct_link_from_voe(embeded_voe_link: str) -> str:
         except Exception:
             pass
 
-    b64_match = re.search(r"var a168c='([^']+)'", html)
+    b64_match = patterns["a168c"].search(html)
     if b64_match:
         try:
             decoded = base64.b64decode(b64_match.group(1)).decode()[::-1]
@@ -370,7 +401,7 @@ def get_direct_link_from_voe(embeded_voe_link: str) -> str:
         except Exception:
             pass
 
-    hls_match = re.search(r"'hls': '(?P<hls>[^']+)'", html)
+    hls_match = patterns["hls"].search(html)
     if hls_match:
         try:
             return base64.b64decode(hls_match.group("hls")).decode()
@@ -1,108 +1,157 @@
-import sys
+import json
 import threading
-import subprocess
 from PyQt6.QtWidgets import (
     QWidget,
     QVBoxLayout,
+    QHBoxLayout,
     QLabel,
     QLineEdit,
+    QPlainTextEdit,
     QPushButton,
     QTextEdit,
     QFileDialog,
     QMessageBox,
     QProgressBar,
+    QSpinBox,
+    QTableWidget,
+    QTableWidgetItem,
+    QHeaderView,
+    QCheckBox,
 )
-from PyQt6.QtCore import pyqtSignal, QObject
-import re
+from PyQt6.QtCore import pyqtSignal, QObject, QTimer
 import os
 
+from cache import DEFAULT_CACHE_DIR
+from profiling import configure_profiling, stop_profiling
+from downloader import derive_output_filename
+from tuning import DEFAULT_TUNING_PATH, configure_tuning
+from pipeline import (
+    BandwidthBudget,
+    ProgressChannel,
+    ProgressEvent,
+    configure_pipeline,
+    download_episode,
+)
+
+
+PROGRESS_UPDATES_PER_SECOND = 4
+QUEUE_PATH = os.path.join(DEFAULT_CACHE_DIR, "gui_queue.json")
+
 
 class WorkerSignals(QObject):
-    output = pyqtSignal(str)
-    error = pyqtSignal(str)
-    progress = pyqtSignal(int)
-    finished = pyqtSignal()
+    finished = pyqtSignal(bool)
+
+
+class DownloadJob:
+    def __init__(self, episode_url: str, output_dir: str, status: str = "queued"):
+        self.episode_url = episode_url
+        self.output_dir = output_dir
+        self.status = status
+        self.channel = ProgressChannel(max_updates_per_second=PROGRESS_UPDATES_PER_SECOND)
+        self.signals = None
+        self.worker = None
+        self.progress_bar = None
+
+    @property
+    def name(self) -> str:
+        return os.path.splitext(derive_output_filename(self.episode_url))[0]
 
 
 class DownloadWorker(threading.Thread):
-    def __init__(self, episode_url: str, output_dir: str, signals: WorkerSignals):
-        super().__init__()
+    def __init__(
+        self,
+        episode_url: str,
+        output_dir: str,
+        signals: WorkerSignals,
+        channel: ProgressChannel,
+        bandwidth: BandwidthBudget = None,
+    ):
+        super().__init__(daemon=True)
         self.episode_url = episode_url
         self.output_dir = output_dir
         self.signals = signals
+        self.channel = channel
+        self.bandwidth = bandwidth
         self.open_video = False
         self.open_folder = False
 
     def run(self):
+        success = False
         try:
-            script_path = os.path.abspath(os.path.join(os.getcwd(), "AIProjekte/aniworld_single_downloader/downloader.py"))
-            cmd = [
-                sys.executable,
-                script_path,
+            filename = download_episode(
                 self.episode_url,
-            ]
-            process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                cwd=self.output_dir,
+                self.output_dir,
+                on_progress=self.channel.push_progress,
+                on_log=self.channel.push_log,
+                bandwidth=self.bandwidth,
             )
-            progress_pattern = re.compile(r"\[download\]\s+(\d{1,3}\.\d)%")
-            output_lines = []
-            for line in process.stdout:
-                self.signals.output.emit(line)
-                output_lines.append(line)
-                match = progress_pattern.search(line)
-                if match:
-                    progress_value = int(float(match.group(1)))
-                    self.signals.progress.emit(progress_value)
-            for line in process.stderr:
-                self.signals.error.emit(line)
-            process.wait()
-            if process.returncode == 0:
-                self.signals.output.emit("Download completed successfully.\n")
-                self.signals.progress.emit(100)
-                if self.open_video or self.open_folder:
-                    filename = None
-                    for out_line in reversed(output_lines):
-                        if "Downloading to " in out_line:
-                            filename = out_line.strip().split("Downloading to ")[-1]
-                            break
-                    if filename:
-                        if self.open_video:
-                            try:
-                                os.startfile(filename)
-                            except Exception as e:
-                                self.signals.error.emit(f"Failed to open video file: {e}\n")
-                        elif self.open_folder:
-                            folder_path = os.path.dirname(filename)
-                            try:
-                                os.startfile(folder_path)
-                            except Exception as e:
-                                self.signals.error.emit(f"Failed to open folder: {e}\n")
-            else:
-                self.signals.error.emit(f"Download failed with exit code {process.returncode}\n")
+            success = True
+            self.channel.push_log("Download completed successfully.")
+            self.channel.push_progress(ProgressEvent(status="finished", filename=filename))
+            if self.open_video:
+                try:
+                    os.startfile(filename)
+                except Exception as e:
+                    self.channel.push_log(f"Failed to open video file: {e}")
+            elif self.open_folder:
+                folder_path = os.path.dirname(filename)
+                try:
+                    os.startfile(folder_path)
+                except Exception as e:
+                    self.channel.push_log(f"Failed to open folder: {e}")
         except Exception as e:
-            self.signals.error.emit(f"Error running downloader: {e}\n")
+            self.channel.push_log(f"Error running downloader: {e}")
         finally:
-            self.signals.finished.emit()
+            self.signals.finished.emit(success)
+
+
+def format_progress(event: ProgressEvent) -> str:
+    if event.status == "resolving":
+        return "Resolving direct link..."
+    if event.status == "finished":
+        return f"Finished: {os.path.basename(event.filename or '')}"
+
+    parts = []
+    if event.downloaded_bytes is not None:
+        done = f"{event.downloaded_bytes / 1024 / 1024:.1f} MiB"
+        if event.total_bytes:
+            done += f" of {event.total_bytes / 1024 / 1024:.1f} MiB"
+        parts.append(done)
+    if event.speed:
+        parts.append(f"{event.speed / 1024 / 1024:.2f} MiB/s")
+    if event.eta is not None:
+        minutes, seconds = divmod(int(event.eta), 60)
+        parts.append(f"ETA {minutes}:{seconds:02d}")
+    return ", ".join(parts)
 
 
 class AniWorldDownloaderGUI(QWidget):
+    COLUMNS = ["Episode", "Status", "Progress", "Details"]
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("AniWorld Single Episode Downloader")
-        self.setMinimumSize(600, 500)
+        self.setMinimumSize(800, 600)
+        self.jobs = []
+        self.bandwidth = BandwidthBudget()
         self.init_ui()
-        self.worker = None
+        self.progress_timer = QTimer(self)
+        self.progress_timer.setInterval(int(1000 / PROGRESS_UPDATES_PER_SECOND))
+        self.progress_timer.timeout.connect(self.flush_progress)
+        self.progress_timer.start()
+        QTimer.singleShot(0, self.finish_startup)
+
+    def finish_startup(self):
+        configure_pipeline()
+        self.load_queue()
 
     def init_ui(self):
         layout = QVBoxLayout()
 
-        label = QLabel("Episode URL:")
-        self.url_input = QLineEdit()
-        self.url_input.setPlaceholderText("Enter the aniworld.to episode URL here")
+        label = QLabel("Episode URLs (one per line):")
+        self.url_input = QPlainTextEdit()
+        self.url_input.setPlaceholderText("Enter one or more aniworld.to episode URLs here")
+        self.url_input.setMaximumHeight(90)
 
         output_label = QLabel("Output Directory:")
         self.output_dir_input = QLineEdit()
@@ -111,12 +160,40 @@ class AniWorldDownloaderGUI(QWidget):
         browse_button = QPushButton("Browse")
         browse_button.clicked.connect(self.browse_output_dir)
 
-        self.download_button = QPushButton("Start Download")
+        settings_layout = QHBoxLayout()
+        settings_layout.addWidget(QLabel("Parallel downloads:"))
+        self.parallel_input = QSpinBox()
+        self.parallel_input.setRange(1, 8)
+        self.parallel_input.setValue(2)
+        self.parallel_input.valueChanged.connect(self.start_pending_jobs)
+        settings_layout.addWidget(self.parallel_input)
+        settings_layout.addWidget(QLabel("Bandwidth limit (KiB/s, 0 = unlimited):"))
+        self.bandwidth_input = QSpinBox()
+        self.bandwidth_input.setRange(0, 10_000_000)
+        self.bandwidth_input.setSingleStep(256)
+        self.bandwidth_input.valueChanged.connect(self.update_bandwidth)
+        settings_layout.addWidget(self.bandwidth_input)
+        self.profile_checkbox = QCheckBox("Profile stages")
+        self.profile_checkbox.toggled.connect(self.toggle_profiling)
+        settings_layout.addWidget(self.profile_checkbox)
+        self.adaptive_checkbox = QCheckBox("Adaptive fragments")
+        self.adaptive_checkbox.toggled.connect(self.toggle_adaptive_fragments)
+        settings_layout.addWidget(self.adaptive_checkbox)
+        settings_layout.addStretch()
+
+        self.download_button = QPushButton("Add to Queue")
         self.download_button.clicked.connect(self.start_download)
+        clear_button = QPushButton("Remove Finished")
+        clear_button.clicked.connect(self.remove_finished_jobs)
+        button_layout = QHBoxLayout()
+        button_layout.addWidget(self.download_button)
+        button_layout.addWidget(clear_button)
 
-        self.progress_bar = QProgressBar()
-        self.progress_bar.setRange(0, 100)
-        self.progress_bar.setValue(0)
+        self.queue_table = QTableWidget(0, len(self.COLUMNS))
+        self.queue_table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.queue_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        self.queue_table.horizontalHeader().setSectionResizeMode(3, QHeaderView.ResizeMode.Stretch)
+        self.queue_table.verticalHeader().setVisible(False)
 
         self.log_output = QTextEdit()
         self.log_output.setReadOnly(True)
@@ -126,8 +203,9 @@ class AniWorldDownloaderGUI(QWidget):
         layout.addWidget(output_label)
         layout.addWidget(self.output_dir_input)
         layout.addWidget(browse_button)
-        layout.addWidget(self.download_button)
-        layout.addWidget(self.progress_bar)
+        layout.addLayout(settings_layout)
+        layout.addLayout(button_layout)
+        layout.addWidget(self.queue_table)
         layout.addWidget(self.log_output)
 
         self.setLayout(layout)
@@ -141,33 +219,137 @@ class AniWorldDownloaderGUI(QWidget):
         self.log_output.append(text)
         self.log_output.ensureCursorVisible()
 
-    def update_progress(self, value: int):
-        self.progress_bar.setValue(value)
+    def update_bandwidth(self, value: int):
+        self.bandwidth.set_limit(value * 1024)
+
+    def toggle_profiling(self, enabled: bool):
+        if enabled:
+            configure_profiling()
+            self.append_log("Profiling enabled for new pipeline stages.")
+            return
+        try:
+            summary_path = stop_profiling()
+        except OSError as e:
+            self.append_log(f"Failed to write profile: {e}")
+            return
+        if summary_path:
+            self.append_log(f"Profile written to {os.path.dirname(summary_path)}")
+
+    def toggle_adaptive_fragments(self, enabled: bool):
+        configure_tuning(DEFAULT_TUNING_PATH if enabled else None)
+        if enabled:
+            self.append_log("Adaptive fragment concurrency enabled for new downloads.")
+        else:
+            self.append_log("Adaptive fragment concurrency disabled for new downloads.")
+
+    def add_job(self, job: DownloadJob):
+        row = self.queue_table.rowCount()
+        self.queue_table.insertRow(row)
+        self.queue_table.setItem(row, 0, QTableWidgetItem(job.name))
+        self.queue_table.setItem(row, 1, QTableWidgetItem(job.status))
+        job.progress_bar = QProgressBar()
+        job.progress_bar.setRange(0, 100)
+        job.progress_bar.setValue(100 if job.status == "done" else 0)
+        self.queue_table.setCellWidget(row, 2, job.progress_bar)
+        self.queue_table.setItem(row, 3, QTableWidgetItem(""))
+        self.jobs.append(job)
+
+    def set_job_status(self, job: DownloadJob, status: str):
+        job.status = status
+        row = self.jobs.index(job)
+        self.queue_table.item(row, 1).setText(status)
+        self.save_queue()
+
+    def update_progress(self, job: DownloadJob, event: ProgressEvent):
+        if event.status == "finished" and event.downloaded_bytes is None:
+            job.progress_bar.setValue(100)
+        elif event.percent is not None:
+            job.progress_bar.setValue(int(event.percent))
+        row = self.jobs.index(job)
+        self.queue_table.item(row, 3).setText(format_progress(event))
+
+    def flush_progress(self, force: bool = False):
+        lines = []
+        for job in self.jobs:
+            if job.status != "running" and not force:
+                continue
+            event, job_lines = job.channel.drain(force=force)
+            lines.extend(f"[{job.name}] {line}" for line in job_lines)
+            if event is not None:
+                self.update_progress(job, event)
+        if lines:
+            self.append_log("\n".join(lines))
 
     def start_download(self):
-        episode_url = self.url_input.text().strip()
+        episode_urls = [line.strip() for line in self.url_input.toPlainText().splitlines() if line.strip()]
         output_dir = self.output_dir_input.text().strip()
 
-        if not episode_url:
+        if not episode_urls:
             QMessageBox.warning(self, "Input Error", "Please enter an episode URL.")
             return
         if not output_dir:
             QMessageBox.warning(self, "Input Error", "Please select an output directory.")
             return
 
-        self.download_button.setEnabled(False)
-        self.log_output.clear()
-        self.progress_bar.setValue(0)
+        for episode_url in episode_urls:
+            self.add_job(DownloadJob(episode_url, output_dir))
+        self.url_input.clear()
+        self.save_queue()
+        self.start_pending_jobs()
+
+    def start_pending_jobs(self):
+        running = sum(1 for job in self.jobs if job.status == "running")
+        for job in self.jobs:
+            if running >= self.parallel_input.value():
+                break
+            if job.status != "queued":
+                continue
+            job.signals = WorkerSignals()
+            job.signals.finished.connect(lambda success, job=job: self.download_finished(job, success))
+            job.worker = DownloadWorker(
+                job.episode_url, job.output_dir, job.signals, job.channel, self.bandwidth
+            )
+            self.set_job_status(job, "running")
+            job.worker.start()
+            running += 1
+
+    def download_finished(self, job: DownloadJob, success: bool):
+        event, lines = job.channel.drain(force=True)
+        if lines:
+            self.append_log("\n".join(f"[{job.name}] {line}" for line in lines))
+        if event is not None:
+            self.update_progress(job, event)
+        self.set_job_status(job, "done" if success else "failed")
+        self.append_log(f"[{job.name}] Download process finished.")
+        self.start_pending_jobs()
 
-        self.signals = WorkerSignals()
-        self.signals.output.connect(self.append_log)
-        self.signals.error.connect(self.append_log)
-        self.signals.progress.connect(self.update_progress)
-        self.signals.finished.connect(self.download_finished)
+    def remove_finished_jobs(self):
+        for row in reversed(range(len(self.jobs))):
+            if self.jobs[row].status in ("done", "failed"):
+                self.queue_table.removeRow(row)
+                del self.jobs[row]
+        self.save_queue()
 
-        self.worker = DownloadWorker(episode_url, output_dir, self.signals)
-        self.worker.start()
+    def save_queue(self):
+        entries = [
+            {"episode_url": job.episode_url, "output_dir": job.output_dir, "status": job.status}
+            for job in self.jobs
+            if job.status != "done"
+        ]
+        try:
+            os.makedirs(os.path.dirname(QUEUE_PATH), exist_ok=True)
+            with open(QUEUE_PATH, "w", encoding="utf-8") as handle:
+                json.dump(entries, handle, indent=2)
+        except OSError as e:
+            self.append_log(f"Failed to save queue: {e}")
 
-    def download_finished(self):
-        self.download_button.setEnabled(True)
-        self.append_log("Download process finished.")
+    def load_queue(self):
+        try:
+            with open(QUEUE_PATH, encoding="utf-8") as handle:
+                entries = json.load(handle)
+        except (OSError, ValueError):
+            return
+        for entry in entries:
+            status = "failed" if entry.get("status") == "failed" else "queued"
+            self.add_job(DownloadJob(entry["episode_url"], entry["output_dir"], status))
+        self.start_pending_jobs()
@@ -0,0 +1,179 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from cache import DEFAULT_CACHE_DIR
+from metrics import Span, add_span_listener, remove_span_listener
+
+
+DEFAULT_HEALTH_PATH = os.path.join(DEFAULT_CACHE_DIR, "provider_health.json")
+HALF_LIFE_SECONDS = 3 * 24 * 3600
+EWMA_WEIGHT = 0.3
+DEFAULT_RESOLVE_SECONDS = 5.0
+DEFAULT_THROUGHPUT = 2 * 1024 * 1024
+DEFAULT_EPISODE_BYTES = 300 * 1024 * 1024
+BROKEN_SUCCESS_RATE = 0.2
+BROKEN_MIN_SAMPLES = 3.0
+
+
+class HealthStore:
+    def __init__(self, path: Optional[str] = DEFAULT_HEALTH_PATH, half_life: float = HALF_LIFE_SECONDS):
+        self.path = path
+        self.half_life = half_life
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = self._load()
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if not self.path:
+            return {}
+        try:
+            with open(self.path, encoding="utf-8") as handle:
+                data = json.load(handle)
+        except (OSError, ValueError):
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        with self._lock:
+            payload = json.dumps(self._entries, indent=2, sort_keys=True)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as handle:
+            handle.write(payload)
+        os.replace(tmp_path, self.path)
+
+    def _save_quietly(self) -> None:
+        try:
+            self.save()
+        except OSError:
+            pass
+
+    def _entry(self, key: str, now: float) -> Dict[str, Any]:
+        entry = self._entries.setdefault(key, {"successes": 0.0, "failures": 0.0, "updated_at": now})
+        decay = 0.5 ** (max(0.0, now - entry["updated_at"]) / self.half_life)
+        entry["successes"] *= decay
+        entry["failures"] *= decay
+        entry["updated_at"] = now
+        return entry
+
+    @staticmethod
+    def _ewma(entry: Dict[str, Any], field: str, value: float) -> None:
+        previous = entry.get(field)
+        entry[field] = value if previous is None else previous + EWMA_WEIGHT * (value - previous)
+
+    def record_resolution(self, provider: str, ok: bool, seconds: float) -> None:
+        now = time.time()
+        with self._lock:
+            entry = self._entry(f"provider:{provider}", now)
+            entry["successes" if ok else "failures"] += 1
+            if ok:
+                self._ewma(entry, "resolve_seconds", seconds)
+        self._save_quietly()
+
+    def record_download(
+        self, provider: str, host: str, ok: bool, nbytes: int, seconds: float
+    ) -> None:
+        now = time.time()
+        with self._lock:
+            for key in (f"provider:{provider}", f"host:{host}"):
+                if key == "host:":
+                    continue
+                entry = self._entry(key, now)
+                entry["successes" if ok else "failures"] += 1
+                if ok and nbytes and seconds > 0:
+                    self._ewma(entry, "throughput", nbytes / seconds)
+        self._save_quietly()
+
+    def _snapshot(self, key: str) -> Dict[str, Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return {"successes": 0.0, "failures": 0.0}
+        decay = 0.5 ** (max(0.0, time.time() - entry["updated_at"]) / self.half_life)
+        snapshot = dict(entry)
+        snapshot["successes"] = entry["successes"] * decay
+        snapshot["failures"] = entry["failures"] * decay
+        return snapshot
+
+    def success_rate(self, provider: str) -> float:
+        with self._lock:
+            entry = self._snapshot(f"provider:{provider}")
+        return (entry["successes"] + 1) / (entry["successes"] + entry["failures"] + 2)
+
+    def is_broken(self, provider: str) -> bool:
+        with self._lock:
+            entry = self._snapshot(f"provider:{provider}")
+        samples = entry["successes"] + entry["failures"]
+        rate = (entry["successes"] + 1) / (samples + 2)
+        return samples >= BROKEN_MIN_SAMPLES and rate < BROKEN_SUCCESS_RATE
+
+    def throughput(self, provider: str, host: Optional[str] = None) -> float:
+        with self._lock:
+            if host:
+                value = self._snapshot(f"host:{host}").get("throughput")
+                if value:
+                    return value
+            return self._snapshot(f"provider:{provider}").get("throughput") or DEFAULT_THROUGHPUT
+
+    def expected_seconds(
+        self,
+        provider: str,
+        host: Optional[str] = None,
+        resolved: bool = False,
+        size: int = DEFAULT_EPISODE_BYTES,
+    ) -> float:
+        with self._lock:
+            entry = self._snapshot(f"provider:{provider}")
+        resolve_seconds = 0.0 if resolved else entry.get("resolve_seconds", DEFAULT_RESOLVE_SECONDS)
+        total = resolve_seconds + size / self.throughput(provider, host)
+        return total / self.success_rate(provider)
+
+    def rank(self, candidates: Sequence[Tuple[str, int, str]]) -> List[Tuple[str, int, str]]:
+        return sorted(candidates, key=lambda candidate: self.expected_seconds(candidate[0]))
+
+    def report(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            keys = sorted(self._entries)
+            rows = [dict(self._snapshot(key), key=key) for key in keys]
+        return rows
+
+    def observe_span(self, span: Span, error: Optional[BaseException]) -> None:
+        from downloader import DownloadCancelled
+
+        provider = span.tags.get("provider")
+        if not provider or isinstance(error, DownloadCancelled):
+            return
+        if span.stage == "extract":
+            self.record_resolution(provider, error is None, span.duration or 0.0)
+        elif span.stage == "download":
+            self.record_download(
+                provider,
+                span.tags.get("host") or "",
+                error is None,
+                span.fields.get("bytes") or 0,
+                span.duration or 0.0,
+            )
+
+
+_health: Optional[HealthStore] = None
+
+
+def configure_health(path: Optional[str] = DEFAULT_HEALTH_PATH) -> Optional[HealthStore]:
+    global _health
+    if _health is not None:
+        remove_span_listener(_health.observe_span)
+        try:
+            _health.save()
+        except OSError:
+            pass
+    _health = HealthStore(path) if path else None
+    if _health is not None:
+        add_span_listener(_health.observe_span)
+    return _health
+
+
+def get_health() -> Optional[HealthStore]:
+    return _health
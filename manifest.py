@@ -0,0 +1,156 @@
+import json
+import logging
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from typing import Any, Dict, Iterable, Iterator, Optional, TextIO
+
+from batch import enumerate_episodes, is_collection_url
+from cache import direct_link_expiry
+from downloader import (
+    DEFAULT_PROBE_BYTES,
+    DEFAULT_SELECT,
+    expand_redirects,
+    fetch_providers,
+    invalidate_episode,
+)
+from metrics import collect_spans
+from providers import PROVIDER_HEADERS, get_provider
+from resolver import select_resolution
+from sessions import parse_header_lines
+
+
+def read_urls(handle: TextIO) -> Iterator[str]:
+    for line in handle:
+        url = line.strip()
+        if url and not url.startswith("#"):
+            yield url
+
+
+def expand_urls(urls: Iterable[str]) -> Iterator[str]:
+    for url in urls:
+        if not is_collection_url(url):
+            yield url
+            continue
+        try:
+            episode_urls = enumerate_episodes(url)
+        except Exception as err:
+            logging.error(f"Failed to enumerate episodes of {url}: {err}")
+            continue
+        logging.info(f"Found {len(episode_urls)} episodes for {url}")
+        yield from episode_urls
+
+
+def resolve_entry(
+    episode_url: str,
+    language_key: int = 3,
+    select: str = DEFAULT_SELECT,
+    probe_bytes: int = DEFAULT_PROBE_BYTES,
+) -> Dict[str, Any]:
+    entry: Dict[str, Any] = {"episode_url": episode_url}
+    start = time.perf_counter()
+    with collect_spans() as spans:
+        try:
+            providers = fetch_providers(episode_url)
+            embeds = expand_redirects(providers)
+            languages: Dict[str, Dict[str, Dict[str, Optional[str]]]] = {}
+            for name, lang_map in sorted(providers.items()):
+                for lang_key, redirect_url in lang_map.items():
+                    languages.setdefault(str(lang_key), {})[name] = {
+                        "redirect_url": redirect_url,
+                        "embed_url": embeds.get(name, {}).get(lang_key),
+                    }
+            entry["providers"] = dict(sorted(languages.items()))
+            resolution = select_resolution(providers, language_key, select, probe_bytes)
+        except Exception as err:
+            invalidate_episode(episode_url)
+            entry["status"] = "error"
+            entry["error"] = str(err)
+        else:
+            spec = get_provider(resolution.provider)
+            expires_at = direct_link_expiry(resolution.direct_link)
+            entry.update(
+                status="ok",
+                provider=resolution.provider,
+                language_key=resolution.language_key,
+                redirect_url=resolution.redirect_url,
+                embed_url=resolution.embed_url,
+                direct_link=resolution.direct_link,
+                headers=parse_header_lines(PROVIDER_HEADERS.get(resolution.provider, [])),
+                hls=bool(spec and spec.hls),
+                expires_in=round(expires_at - time.time()) if expires_at is not None else None,
+                expires_at=round(expires_at) if expires_at is not None else None,
+            )
+    entry["seconds"] = round(time.perf_counter() - start, 6)
+    entry["timings"] = [
+        {
+            "stage": current.stage,
+            "provider": current.tags.get("provider"),
+            "host": current.tags.get("host"),
+            "seconds": round(current.duration or 0.0, 6),
+            "status": "error" if error is not None else "ok",
+        }
+        for current, error in spans
+    ]
+    return entry
+
+
+def write_manifest(
+    episode_urls: Iterable[str],
+    output: TextIO,
+    language_key: int = 3,
+    select: str = DEFAULT_SELECT,
+    probe_bytes: int = DEFAULT_PROBE_BYTES,
+    workers: int = 4,
+) -> int:
+    failures = 0
+    lock = threading.Lock()
+    slots = threading.BoundedSemaphore(workers * 2)
+
+    def _resolve(episode_url: str) -> None:
+        nonlocal failures
+        try:
+            entry = resolve_entry(episode_url, language_key, select, probe_bytes)
+        except Exception as err:
+            entry = {"episode_url": episode_url, "status": "error", "error": str(err)}
+        finally:
+            slots.release()
+        if entry["status"] != "ok":
+            logging.error(f"Resolution failed for {episode_url}: {entry['error']}")
+        line = json.dumps(entry, ensure_ascii=False)
+        with lock:
+            if entry["status"] != "ok":
+                failures += 1
+            output.write(line + "\n")
+            output.flush()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for episode_url in episode_urls:
+            slots.acquire()
+            pool.submit(_resolve, episode_url)
+    return failures
+
+
+def run_manifest(
+    source: str,
+    manifest_path: Optional[str] = None,
+    language_key: int = 3,
+    select: str = DEFAULT_SELECT,
+    probe_bytes: int = DEFAULT_PROBE_BYTES,
+    workers: int = 4,
+) -> int:
+    with ExitStack() as stack:
+        if source == "-":
+            urls: Iterable[str] = read_urls(sys.stdin)
+        elif "://" in source:
+            urls = [source]
+        else:
+            urls = read_urls(stack.enter_context(open(source, encoding="utf-8")))
+        output = sys.stdout
+        if manifest_path and manifest_path != "-":
+            output = stack.enter_context(open(manifest_path, "w", encoding="utf-8"))
+        return write_manifest(
+            expand_urls(urls), output, language_key, select, probe_bytes, max(1, workers)
+        )
@@ -0,0 +1,230 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, TextIO, Tuple
+from urllib.parse import urlparse
+
+from profiling import profile_stage
+
+
+METRIC_PREFIX = "aniworld"
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 1800.0)
+LABEL_NAMES = ("stage", "provider", "host")
+
+LabelKey = Tuple[Tuple[str, str], ...]
+SpanListener = Callable[["Span", Optional[BaseException]], None]
+CollectedSpan = Tuple["Span", Optional[BaseException]]
+
+
+def host_of(url: Optional[str]) -> str:
+    return (urlparse(url).hostname or "") if url else ""
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items() if value not in (None, "")))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class MetricsRegistry:
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, List[float]]] = {}
+
+    def inc(self, name: str, value: float = 1.0, **labels: Any) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            counts = series.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            counts[-2] += 1
+            counts[-1] += value
+
+    def render_prometheus(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                full_name = f"{METRIC_PREFIX}_{name}"
+                lines.append(f"# TYPE {full_name} counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{full_name}{_format_labels(key)} {value:g}")
+            for name, series in sorted(self._histograms.items()):
+                full_name = f"{METRIC_PREFIX}_{name}"
+                lines.append(f"# TYPE {full_name} histogram")
+                for key, counts in sorted(series.items()):
+                    for bound, count in zip(self.buckets, counts):
+                        lines.append(f"{full_name}_bucket{_format_labels(key, ('le', f'{bound:g}'))} {count:g}")
+                    lines.append(f"{full_name}_bucket{_format_labels(key, ('le', '+Inf'))} {counts[-2]:g}")
+                    lines.append(f"{full_name}_count{_format_labels(key)} {counts[-2]:g}")
+                    lines.append(f"{full_name}_sum{_format_labels(key)} {counts[-1]:g}")
+        return "\n".join(lines) + "\n"
+
+
+class Span:
+    def __init__(self, stage: str, tags: Dict[str, Any]):
+        self.stage = stage
+        self.tags = dict(tags)
+        self.fields: Dict[str, Any] = {}
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.duration: Optional[float] = None
+
+    def tag(self, **tags: Any) -> None:
+        self.tags.update(tags)
+
+    def set(self, **fields: Any) -> None:
+        self.fields.update(fields)
+
+    def finish(self) -> float:
+        self.duration = time.perf_counter() - self._start
+        nbytes = self.fields.get("bytes")
+        if nbytes and self.duration > 0:
+            self.fields.setdefault("avg_speed", nbytes / self.duration)
+        return self.duration
+
+
+class TransferMeter:
+    def __init__(self):
+        self.bytes = 0
+        self.peak_speed = 0.0
+
+    def on_progress(self, event: Any) -> None:
+        if getattr(event, "downloaded_bytes", None):
+            self.bytes = max(self.bytes, event.downloaded_bytes)
+        if getattr(event, "speed", None):
+            self.peak_speed = max(self.peak_speed, event.speed)
+
+    def apply(self, span: Span) -> None:
+        if self.bytes:
+            span.set(bytes=self.bytes)
+        if self.peak_speed:
+            span.set(peak_speed=self.peak_speed)
+
+
+class Metrics:
+    def __init__(self, trace_path: Optional[str] = None, stream: Optional[TextIO] = None):
+        self.registry = MetricsRegistry()
+        self.trace_path = trace_path
+        self._stream = stream
+        self._lock = threading.Lock()
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, default=str)
+        with self._lock:
+            if self._stream is not None:
+                self._stream.write(line + "\n")
+                self._stream.flush()
+            elif self.trace_path:
+                os.makedirs(os.path.dirname(os.path.abspath(self.trace_path)), exist_ok=True)
+                with open(self.trace_path, "a", encoding="utf-8") as handle:
+                    handle.write(line + "\n")
+
+    def record(self, span: Span, error: Optional[BaseException] = None) -> None:
+        duration = span.duration if span.duration is not None else span.finish()
+        status = "error" if error is not None else "ok"
+        labels = {name: span.tags.get(name) for name in LABEL_NAMES[1:]}
+        self.registry.inc("stage_total", stage=span.stage, status=status, **labels)
+        self.registry.observe("stage_duration_seconds", duration, stage=span.stage, **labels)
+        if span.stage == "download" and span.fields.get("bytes"):
+            self.registry.inc("download_bytes_total", span.fields["bytes"], **labels)
+        collected = _collector.get()
+        if collected is not None:
+            collected.append((span, error))
+        for listener in list(_listeners):
+            try:
+                listener(span, error)
+            except Exception as err:
+                logging.debug(f"Span listener failed: {err}")
+        if self.trace_path is None and self._stream is None:
+            return
+        record: Dict[str, Any] = {
+            "ts": span.started_at,
+            "stage": span.stage,
+            "duration": round(duration, 6),
+            "status": status,
+        }
+        record.update(span.tags)
+        record.update(span.fields)
+        if error is not None:
+            record["error"] = f"{type(error).__name__}: {error}"
+        self._write(record)
+
+    @contextmanager
+    def span(self, stage: str, **tags: Any) -> Iterator[Span]:
+        current = Span(stage, tags)
+        try:
+            yield current
+        except BaseException as err:
+            current.finish()
+            self.record(current, err)
+            raise
+        current.finish()
+        self.record(current)
+
+    def write_prometheus(self, path: str) -> None:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as handle:
+            handle.write(self.registry.render_prometheus())
+        os.replace(tmp_path, path)
+
+
+_metrics = Metrics()
+_listeners: List[SpanListener] = []
+_collector: "contextvars.ContextVar[Optional[List[CollectedSpan]]]" = contextvars.ContextVar(
+    "span_collector", default=None
+)
+
+
+def configure_metrics(trace_path: Optional[str] = None, stream: Optional[TextIO] = None) -> Metrics:
+    global _metrics
+    _metrics = Metrics(trace_path, stream)
+    return _metrics
+
+
+def get_metrics() -> Metrics:
+    return _metrics
+
+
+def add_span_listener(listener: SpanListener) -> None:
+    _listeners.append(listener)
+
+
+def remove_span_listener(listener: SpanListener) -> None:
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+
+@contextmanager
+def collect_spans() -> Iterator[List[CollectedSpan]]:
+    collected: List[CollectedSpan] = []
+    token = _collector.set(collected)
+    try:
+        yield collected
+    finally:
+        _collector.reset(token)
+
+
+@contextmanager
+def span(stage: str, **tags: Any) -> Iterator[Span]:
+    with _metrics.span(stage, **tags) as current, profile_stage(stage):
+        yield current
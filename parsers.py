@@ -0,0 +1,154 @@
+import html
+import importlib.util
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urljoin
+
+LXML_AVAILABLE = importlib.util.find_spec("lxml") is not None
+
+
+ProviderMap = Dict[str, Dict[int, str]]
+ProviderEntry = Tuple[Optional[str], Optional[str], Optional[str]]
+
+TAG_BODY = r"""[^"'>]*(?:(?:"[^"]*"|'[^']*')[^"'>]*)*"""
+COMMENT_RE = re.compile(r"<!--.*?-->", re.DOTALL)
+LI_TAG_RE = re.compile(r"<(/?)li\b" + TAG_BODY + ">", re.IGNORECASE)
+ATTRIBUTE_RE = re.compile(
+    r"""([\w:-]+)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))"""
+)
+ANCHOR_OPEN_RE = re.compile(r"<a\b" + TAG_BODY + ">", re.IGNORECASE)
+H4_RE = re.compile(r"<h4\b[^>]*>(.*?)</h4\s*>", re.IGNORECASE | re.DOTALL)
+TAG_RE = re.compile(r"<[^>]+>")
+
+LXML_EPISODE_LINK_XPATH = (
+    "//li[starts-with(@class, 'episodeLink') "
+    "or contains(concat(' ', normalize-space(@class)), ' episodeLink')]"
+)
+LXML_ANCHOR_XPATH = (
+    ".//a[contains(concat(' ', normalize-space(@class), ' '), ' watchEpisode ')]"
+)
+
+
+def _tag_attributes(tag: str) -> Dict[str, str]:
+    attributes = {}
+    for name, double, single, bare in ATTRIBUTE_RE.findall(tag):
+        attributes[name.lower()] = html.unescape(double or single or bare)
+    return attributes
+
+
+def _scan_regex(html_content: str) -> List[ProviderEntry]:
+    if "<!--" in html_content:
+        html_content = COMMENT_RE.sub("", html_content)
+    start = html_content.find("episodeLink")
+    if start == -1:
+        return []
+    start = max(0, html_content.rfind("<li", 0, start))
+
+    tags = list(LI_TAG_RE.finditer(html_content, start))
+    closing = [bool(tag.group(1)) for tag in tags]
+    entries: List[ProviderEntry] = []
+    for index, open_match in enumerate(tags):
+        if closing[index] or "episodeLink" not in open_match.group(0):
+            continue
+        li_attributes = _tag_attributes(open_match.group(0))
+        if not any(name.startswith("episodeLink") for name in li_attributes.get("class", "").split()):
+            continue
+        depth = 0
+        for close_index in range(index + 1, len(tags)):
+            depth += -1 if closing[close_index] else 1
+            if depth < 0:
+                break
+        else:
+            raise ValueError("Unbalanced <li> tags around the provider list.")
+        body = html_content[open_match.end():tags[close_index].start()]
+
+        lang_key = li_attributes.get("data-lang-key")
+
+        redirect_path = None
+        for anchor in ANCHOR_OPEN_RE.finditer(body):
+            attributes = _tag_attributes(anchor.group(0))
+            if "watchEpisode" in attributes.get("class", "").split():
+                redirect_path = attributes.get("href")
+                break
+
+        h4_match = H4_RE.search(body)
+        provider_name = None
+        if h4_match:
+            provider_name = html.unescape(TAG_RE.sub("", h4_match.group(1))).strip()
+
+        entries.append((provider_name, redirect_path, lang_key))
+    return entries
+
+
+def _scan_lxml(html_content: str) -> List[ProviderEntry]:
+    if not LXML_AVAILABLE:
+        raise ImportError("lxml is not installed.")
+    if "episodeLink" not in html_content:
+        return []
+    import lxml.html as lxml_html
+
+    entries: List[ProviderEntry] = []
+    root = lxml_html.fromstring(html_content)
+    for link in root.xpath(LXML_EPISODE_LINK_XPATH):
+        h4 = link.find(".//h4")
+        provider_name = h4.text_content().strip() if h4 is not None else None
+        anchors = link.xpath(LXML_ANCHOR_XPATH)
+        redirect_path = anchors[0].get("href") if anchors else None
+        entries.append((provider_name, redirect_path, link.get("data-lang-key")))
+    return entries
+
+
+def _scan_soup(html_content: str) -> List[ProviderEntry]:
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html_content, "html.parser")
+    entries: List[ProviderEntry] = []
+    for link in soup.find_all("li", class_=lambda x: x and x.startswith("episodeLink")):
+        provider_tag = link.find("h4")
+        provider_name = provider_tag.get_text(strip=True) if provider_tag else None
+
+        anchor = link.find("a", class_="watchEpisode")
+        redirect_path = anchor.get("href") if anchor else None
+
+        entries.append((provider_name, redirect_path, link.get("data-lang-key")))
+    return entries
+
+
+SCANNERS: Dict[str, Callable[[str], List[ProviderEntry]]] = {
+    "regex": _scan_regex,
+    "lxml": _scan_lxml,
+    "soup": _scan_soup,
+}
+
+
+def _build_provider_map(entries: List[ProviderEntry], base_url: str) -> ProviderMap:
+    providers: ProviderMap = {}
+    for provider_name, redirect_path, lang_key_str in entries:
+        lang_key = int(lang_key_str) if lang_key_str and lang_key_str.isdigit() else None
+        if provider_name and redirect_path and lang_key:
+            redirect_url = urljoin(base_url, redirect_path)
+            providers.setdefault(provider_name, {})[lang_key] = redirect_url
+    return providers
+
+
+def parse_providers(html_content: str, base_url: str, backend: str = "auto") -> ProviderMap:
+    if backend == "auto":
+        try:
+            providers = _build_provider_map(_scan_regex(html_content), base_url)
+        except Exception:
+            providers = {}
+        if providers:
+            return providers
+        backend = "soup"
+
+    if backend not in SCANNERS:
+        raise ValueError(f"Unknown parser backend '{backend}'.")
+
+    entries = SCANNERS[backend](html_content)
+    if not entries:
+        raise ValueError("No streaming providers found on the episode page.")
+
+    providers = _build_provider_map(entries, base_url)
+    if not providers:
+        raise ValueError("Unable to extract providers from episode HTML.")
+    return providers
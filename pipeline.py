@@ -0,0 +1,369 @@
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+
+from cache import DEFAULT_CACHE_PATH, configure_cache
+from downloader import (
+    DEFAULT_FRAGMENT_CONCURRENCY,
+    DEFAULT_FRAGMENT_RETRIES,
+    DEFAULT_NATIVE_CONNECTIONS,
+    DEFAULT_PROBE_BYTES,
+    DEFAULT_SELECT,
+    EXPIRED_MESSAGE_RE,
+    DownloadCancelled,
+    PROVIDER_HEADERS_D,
+    RANDOM_USER_AGENT,
+    LinkExpiredError,
+    derive_output_filename,
+    fetch_providers,
+    invalidate_episode,
+)
+from health import DEFAULT_HEALTH_PATH, configure_health
+from metrics import TransferMeter, host_of, span
+from providers import INSECURE_PROVIDERS
+from tuning import FragmentStats, configure_tuning, get_tuner
+
+if TYPE_CHECKING:
+    from resolver import Resolution
+
+
+@dataclass
+class ProgressEvent:
+    status: str
+    filename: Optional[str] = None
+    downloaded_bytes: Optional[int] = None
+    total_bytes: Optional[int] = None
+    speed: Optional[float] = None
+    eta: Optional[float] = None
+    message: Optional[str] = None
+
+    @property
+    def percent(self) -> Optional[float]:
+        if not self.total_bytes or self.downloaded_bytes is None:
+            return None
+        return min(100.0, self.downloaded_bytes * 100.0 / self.total_bytes)
+
+
+ProgressCallback = Callable[[ProgressEvent], None]
+LogCallback = Callable[[str], None]
+
+
+class ProgressChannel:
+    def __init__(self, max_updates_per_second: float = 4.0, max_buffered_lines: int = 1000):
+        self.min_interval = 1.0 / max_updates_per_second
+        self.max_buffered_lines = max_buffered_lines
+        self._lock = threading.Lock()
+        self._latest: Optional[ProgressEvent] = None
+        self._lines: List[str] = []
+        self._dropped_lines = 0
+        self._last_drain = 0.0
+
+    def push_progress(self, event: ProgressEvent) -> None:
+        with self._lock:
+            self._latest = event
+
+    def push_log(self, line: str) -> None:
+        with self._lock:
+            self._lines.append(line.rstrip("\n"))
+            if len(self._lines) > self.max_buffered_lines:
+                del self._lines[0]
+                self._dropped_lines += 1
+
+    def drain(self, force: bool = False) -> Tuple[Optional[ProgressEvent], List[str]]:
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_drain < self.min_interval:
+                return None, []
+            self._last_drain = now
+            event, self._latest = self._latest, None
+            lines, self._lines = self._lines, []
+            if self._dropped_lines:
+                lines.insert(0, f"... {self._dropped_lines} log lines dropped ...")
+                self._dropped_lines = 0
+        return event, lines
+
+
+class BandwidthBudget:
+    def __init__(self, limit: float = 0):
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._next_slot: Dict[int, float] = {}
+        self._next_id = 0
+
+    def set_limit(self, limit: float) -> None:
+        with self._lock:
+            self.limit = limit
+
+    def register(self) -> int:
+        with self._lock:
+            job_id = self._next_id
+            self._next_id += 1
+            self._next_slot[job_id] = time.monotonic()
+            return job_id
+
+    def unregister(self, job_id: int) -> None:
+        with self._lock:
+            self._next_slot.pop(job_id, None)
+
+    def consume(self, job_id: int, nbytes: int) -> None:
+        with self._lock:
+            if self.limit <= 0 or job_id not in self._next_slot or nbytes <= 0:
+                return
+            share = self.limit / len(self._next_slot)
+            now = time.monotonic()
+            start = max(now - 1.0, self._next_slot[job_id])
+            self._next_slot[job_id] = start + nbytes / share
+            delay = self._next_slot[job_id] - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+class YtdlLogger:
+    def __init__(self, on_log: Optional[LogCallback] = None):
+        self.on_log = on_log
+
+    def debug(self, msg: str) -> None:
+        if msg.startswith("[debug] "):
+            return
+        self.info(msg)
+
+    def info(self, msg: str) -> None:
+        if self.on_log is not None:
+            self.on_log(msg)
+
+    def warning(self, msg: str) -> None:
+        self.info(f"WARNING: {msg}")
+
+    def error(self, msg: str) -> None:
+        self.info(msg)
+
+
+def configure_pipeline(
+    cache_path: Optional[str] = DEFAULT_CACHE_PATH,
+    tuning_path: Optional[str] = None,
+    health_path: Optional[str] = DEFAULT_HEALTH_PATH,
+) -> None:
+    from sessions import configure_sessions
+
+    configure_sessions(
+        provider_headers=PROVIDER_HEADERS_D,
+        default_headers={"User-Agent": RANDOM_USER_AGENT},
+        insecure_providers=INSECURE_PROVIDERS,
+    )
+    configure_cache(cache_path)
+    configure_tuning(tuning_path)
+    configure_health(health_path)
+
+
+def progress_event_from_hook(status: Dict[str, Any]) -> ProgressEvent:
+    return ProgressEvent(
+        status=status.get("status", "downloading"),
+        filename=status.get("filename"),
+        downloaded_bytes=status.get("downloaded_bytes"),
+        total_bytes=status.get("total_bytes") or status.get("total_bytes_estimate"),
+        speed=status.get("speed"),
+        eta=status.get("eta"),
+    )
+
+
+def build_ytdl_options(
+    output_path: str,
+    provider: str,
+    progress_hooks: Optional[List[Callable[[Dict[str, Any]], None]]] = None,
+    on_log: Optional[LogCallback] = None,
+    concurrency: int = DEFAULT_FRAGMENT_CONCURRENCY,
+    ratelimit: Optional[int] = None,
+) -> Dict[str, Any]:
+    from sessions import parse_header_lines
+
+    options = {
+        "outtmpl": output_path,
+        "fragment_retries": DEFAULT_FRAGMENT_RETRIES,
+        "skip_unavailable_fragments": False,
+        "concurrent_fragment_downloads": concurrency,
+        "http_headers": parse_header_lines(PROVIDER_HEADERS_D.get(provider, [])),
+        "quiet": True,
+        "no_warnings": True,
+        "noprogress": True,
+        "progress_hooks": progress_hooks or [],
+        "logger": YtdlLogger(on_log),
+    }
+    if ratelimit:
+        options["ratelimit"] = ratelimit
+    if provider in INSECURE_PROVIDERS:
+        options["nocheckcertificate"] = True
+    return options
+
+
+def run_download_inprocess(
+    direct_link: str,
+    output_path: str,
+    provider: str,
+    on_progress: Optional[ProgressCallback] = None,
+    on_log: Optional[LogCallback] = None,
+    bandwidth: Optional[BandwidthBudget] = None,
+) -> None:
+    import yt_dlp
+
+    job_id = bandwidth.register() if bandwidth is not None else None
+    last_bytes = [0]
+    expired_error: List[str] = []
+    tuner = get_tuner()
+    stats = FragmentStats()
+    if tuner is not None:
+        concurrency, ratelimit = tuner.settings_for(direct_link)
+    else:
+        concurrency, ratelimit = DEFAULT_FRAGMENT_CONCURRENCY, None
+
+    def _hook(status: Dict[str, Any]) -> None:
+        downloaded = status.get("downloaded_bytes") or 0
+        delta, last_bytes[0] = downloaded - last_bytes[0], downloaded
+        if status.get("status") == "downloading":
+            stats.observe_hook(status)
+            if job_id is not None:
+                bandwidth.consume(job_id, delta)
+        if on_progress is not None:
+            on_progress(progress_event_from_hook(status))
+
+    def _log(message: str) -> None:
+        stats.observe_log(message)
+        if message.startswith("ERROR:") and EXPIRED_MESSAGE_RE.search(message):
+            expired_error.append(message)
+        if on_log is not None:
+            on_log(message)
+
+    options = build_ytdl_options(output_path, provider, [_hook], _log, concurrency, ratelimit)
+    try:
+        with yt_dlp.YoutubeDL(options) as ydl:
+            retcode = ydl.download([direct_link])
+    except yt_dlp.utils.DownloadError as exc:
+        if EXPIRED_MESSAGE_RE.search(str(exc)):
+            raise LinkExpiredError(f"yt-dlp failed: {exc}") from exc
+        raise RuntimeError(f"yt-dlp failed: {exc}") from exc
+    except Exception as exc:
+        if not expired_error:
+            raise
+        raise LinkExpiredError(f"yt-dlp failed: {expired_error[-1]}") from exc
+    finally:
+        if job_id is not None:
+            bandwidth.unregister(job_id)
+        if tuner is not None:
+            budget_limited = bandwidth is not None and bandwidth.limit > 0
+            tuner.record(direct_link, stats, measure_throughput=not (budget_limited or ratelimit))
+    if retcode:
+        raise RuntimeError(f"yt-dlp failed with exit code {retcode}")
+
+
+def download_episode(
+    episode_url: str,
+    output_dir: str,
+    language_key: int = 3,
+    select: str = DEFAULT_SELECT,
+    probe_bytes: int = DEFAULT_PROBE_BYTES,
+    on_progress: Optional[ProgressCallback] = None,
+    on_log: Optional[LogCallback] = None,
+    bandwidth: Optional[BandwidthBudget] = None,
+    engine: str = "yt-dlp",
+    connections: int = DEFAULT_NATIVE_CONNECTIONS,
+    cancel_event: Optional[threading.Event] = None,
+) -> str:
+    from resolver import download_with_refresh, invalidate_resolution, select_resolution
+
+    def _log(message: str) -> None:
+        logging.info(message)
+        if on_log is not None:
+            on_log(message)
+
+    def _check_cancelled() -> None:
+        if cancel_event is not None and cancel_event.is_set():
+            raise DownloadCancelled("Cancelled")
+
+    if on_progress is not None:
+        on_progress(ProgressEvent(status="resolving"))
+    _log(f"Resolving episode: {episode_url}")
+    try:
+        _check_cancelled()
+        providers = fetch_providers(episode_url)
+        _check_cancelled()
+        resolution = select_resolution(providers, language_key, select, probe_bytes)
+        _check_cancelled()
+    except DownloadCancelled:
+        raise
+    except Exception:
+        invalidate_episode(episode_url)
+        raise
+    _log(f"Selected provider: {resolution.provider}")
+    _log(f"Direct video URL: {resolution.direct_link}")
+
+    output_path = os.path.join(output_dir, derive_output_filename(episode_url))
+    _log(f"Downloading to {output_path}")
+    meter = TransferMeter()
+
+    def _progress(event: ProgressEvent) -> None:
+        meter.on_progress(event)
+        if on_progress is not None:
+            on_progress(event)
+
+    def _attempt(current_resolution: "Resolution") -> None:
+        _check_cancelled()
+        if current_resolution is not resolution:
+            _log(f"Continuing with provider: {current_resolution.provider}")
+        with span(
+            "download",
+            provider=current_resolution.provider,
+            host=host_of(current_resolution.direct_link),
+            engine=engine,
+        ) as current:
+            try:
+                _download_resolution(
+                    current_resolution, output_path, engine, connections, _progress, on_log, bandwidth, _log
+                )
+            finally:
+                meter.apply(current)
+
+    try:
+        download_with_refresh(resolution, output_path, _attempt, episode_url)
+    except DownloadCancelled:
+        raise
+    except Exception:
+        invalidate_resolution(resolution)
+        raise
+    return output_path
+
+
+def _download_resolution(
+    resolution: "Resolution",
+    output_path: str,
+    engine: str,
+    connections: int,
+    on_progress: ProgressCallback,
+    on_log: Optional[LogCallback],
+    bandwidth: Optional[BandwidthBudget],
+    log: LogCallback,
+) -> None:
+    if engine == "native":
+        from segmented import UnsupportedStreamError, download_native
+
+        try:
+            download_native(
+                resolution.direct_link,
+                output_path,
+                resolution.provider,
+                connections,
+                on_progress=on_progress,
+                bandwidth=bandwidth,
+            )
+            return
+        except UnsupportedStreamError as err:
+            log(f"Native engine cannot handle this stream ({err}), using yt-dlp")
+    run_download_inprocess(
+        resolution.direct_link,
+        output_path,
+        resolution.provider,
+        on_progress=on_progress,
+        on_log=on_log,
+        bandwidth=bandwidth,
+    )
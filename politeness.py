@@ -0,0 +1,161 @@
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Dict, Iterator, Optional
+from urllib.parse import urlparse
+
+import requests
+
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+THROTTLE_STATUSES = {429, 503}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+DEFAULT_MAX_RETRIES = 4
+DEFAULT_BACKOFF_BASE = 0.5
+DEFAULT_BACKOFF_MAX = 30.0
+MAX_RETRY_AFTER = 120.0
+
+
+@dataclass
+class HostPolicy:
+    rate: float = 8.0
+    burst: int = 16
+    max_concurrency: int = 8
+
+
+DEFAULT_HOST_POLICIES: Dict[str, HostPolicy] = {
+    "aniworld.to": HostPolicy(rate=2.0, burst=4, max_concurrency=4),
+}
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+
+
+class _HostState:
+    def __init__(self, policy: HostPolicy):
+        self.bucket = TokenBucket(policy.rate, policy.burst)
+        self.slots = threading.BoundedSemaphore(policy.max_concurrency)
+        self.blocked_until = 0.0
+
+
+def retry_after_seconds(response: requests.Response) -> Optional[float]:
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class PolitenessScheduler:
+    def __init__(
+        self,
+        default_policy: Optional[HostPolicy] = None,
+        host_policies: Optional[Dict[str, HostPolicy]] = None,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        backoff_base: float = DEFAULT_BACKOFF_BASE,
+        backoff_max: float = DEFAULT_BACKOFF_MAX,
+    ):
+        self.default_policy = default_policy or HostPolicy()
+        self.host_policies = DEFAULT_HOST_POLICIES if host_policies is None else host_policies
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._hosts: Dict[str, _HostState] = {}
+        self._lock = threading.Lock()
+
+    def _policy_for(self, host: str) -> HostPolicy:
+        for suffix, policy in self.host_policies.items():
+            if host == suffix or host.endswith("." + suffix):
+                return policy
+        return self.default_policy
+
+    def _state(self, host: str) -> _HostState:
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None:
+                state = _HostState(self._policy_for(host))
+                self._hosts[host] = state
+            return state
+
+    @contextmanager
+    def slot(self, url: str) -> Iterator[None]:
+        state = self._state((urlparse(url).hostname or "").lower())
+        with state.slots:
+            delay = state.blocked_until - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            state.bucket.acquire()
+            yield
+
+    def defer(self, url: str, delay: float) -> None:
+        state = self._state((urlparse(url).hostname or "").lower())
+        with self._lock:
+            state.blocked_until = max(state.blocked_until, time.monotonic() + delay)
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+
+class PoliteSession(requests.Session):
+    def __init__(self, scheduler: PolitenessScheduler):
+        super().__init__()
+        self.scheduler = scheduler
+
+    def request(self, method, url, *args, **kwargs) -> requests.Response:
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            try:
+                with self.scheduler.slot(url):
+                    resp = super().request(method, url, *args, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as err:
+                if not idempotent or attempt >= self.scheduler.max_retries:
+                    raise
+                delay = self.scheduler.backoff(attempt)
+                logging.info(f"{method} {url} failed ({err}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            retryable = RETRY_STATUSES if idempotent else THROTTLE_STATUSES
+            if resp.status_code not in retryable or attempt >= self.scheduler.max_retries:
+                return resp
+            delay = retry_after_seconds(resp)
+            if delay is None:
+                delay = self.scheduler.backoff(attempt)
+            elif delay > MAX_RETRY_AFTER:
+                return resp
+            logging.info(f"{method} {url} returned {resp.status_code}, retrying in {delay:.1f}s")
+            resp.close()
+            if resp.status_code in THROTTLE_STATUSES:
+                self.scheduler.defer(url, delay)
+            else:
+                time.sleep(delay)
+            attempt += 1
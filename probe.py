@@ -0,0 +1,135 @@
+import logging
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urljoin, urlparse
+
+import requests
+
+from downloader import DEFAULT_PROBE_BYTES
+from resolver import Resolution
+from sessions import get_session
+
+
+DEFAULT_PROBE_TIMEOUT = 10
+PROBE_CHUNK_SIZE = 64 * 1024
+
+
+@dataclass
+class ProbeResult:
+    url: str
+    ttfb: float
+    throughput: float
+    bytes_read: int
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.bytes_read > 0
+
+
+def is_hls_url(url: str) -> bool:
+    return urlparse(url).path.lower().endswith(".m3u8")
+
+
+def first_hls_segment(
+    playlist_url: str,
+    session: requests.Session,
+    headers: Optional[Dict[str, str]] = None,
+    timeout: float = DEFAULT_PROBE_TIMEOUT,
+) -> str:
+    resp = session.get(playlist_url, headers=headers, timeout=timeout)
+    resp.raise_for_status()
+    lines = [line.strip() for line in resp.text.splitlines() if line.strip()]
+    uris = [line for line in lines if not line.startswith("#")]
+    if not uris:
+        raise ValueError("No entries found in HLS playlist.")
+
+    if any(line.startswith("#EXT-X-STREAM-INF") for line in lines):
+        return first_hls_segment(urljoin(resp.url, uris[0]), session, headers, timeout)
+    return urljoin(resp.url, uris[0])
+
+
+def probe_link(
+    url: str,
+    session: Optional[requests.Session] = None,
+    headers: Optional[Dict[str, str]] = None,
+    probe_bytes: int = DEFAULT_PROBE_BYTES,
+    timeout: float = DEFAULT_PROBE_TIMEOUT,
+) -> ProbeResult:
+    session = session or get_session()
+    start = time.monotonic()
+    first_byte_at = None
+    bytes_read = 0
+    try:
+        target = first_hls_segment(url, session, headers, timeout) if is_hls_url(url) else url
+        range_headers = dict(headers or {})
+        range_headers["Range"] = f"bytes=0-{probe_bytes - 1}"
+        with session.get(target, headers=range_headers, timeout=timeout, stream=True) as resp:
+            resp.raise_for_status()
+            for chunk in resp.iter_content(PROBE_CHUNK_SIZE):
+                if first_byte_at is None:
+                    first_byte_at = time.monotonic()
+                bytes_read += len(chunk)
+                if bytes_read >= probe_bytes or time.monotonic() - start > timeout:
+                    break
+    except (requests.RequestException, ValueError) as err:
+        return ProbeResult(url, float("inf"), 0.0, bytes_read, str(err))
+
+    end = time.monotonic()
+    if first_byte_at is None:
+        return ProbeResult(url, float("inf"), 0.0, 0, "No data received.")
+    transfer_time = max(end - first_byte_at, 1e-6)
+    return ProbeResult(url, first_byte_at - start, bytes_read / transfer_time, bytes_read)
+
+
+def check_link(
+    url: str,
+    session: Optional[requests.Session] = None,
+    timeout: float = DEFAULT_PROBE_TIMEOUT,
+) -> bool:
+    session = session or get_session()
+    headers = {} if is_hls_url(url) else {"Range": "bytes=0-0"}
+    try:
+        with session.get(url, headers=headers, timeout=timeout, stream=True) as resp:
+            return resp.status_code < 400
+    except requests.RequestException:
+        return False
+
+
+def rank_by_throughput(
+    resolutions: List[Resolution],
+    probe_bytes: int = DEFAULT_PROBE_BYTES,
+    timeout: float = DEFAULT_PROBE_TIMEOUT,
+) -> List[Tuple[Resolution, ProbeResult]]:
+    results = []
+    for resolution in resolutions:
+        result = probe_link(
+            resolution.direct_link,
+            session=get_session(resolution.provider),
+            probe_bytes=probe_bytes,
+            timeout=timeout,
+        )
+        if result.ok:
+            logging.info(
+                f"Probe {resolution.provider}: ttfb {result.ttfb * 1000:.0f} ms, "
+                f"{result.throughput / 1024 / 1024:.2f} MiB/s"
+            )
+        else:
+            logging.info(f"Probe {resolution.provider} failed: {result.error}")
+        results.append((resolution, result))
+
+    results.sort(key=lambda item: (not item[1].ok, -item[1].throughput, item[1].ttfb))
+    return results
+
+
+def select_fastest(
+    resolutions: List[Resolution],
+    probe_bytes: int = DEFAULT_PROBE_BYTES,
+    timeout: float = DEFAULT_PROBE_TIMEOUT,
+) -> Resolution:
+    ranked = rank_by_throughput(resolutions, probe_bytes, timeout)
+    if not ranked[0][1].ok:
+        logging.info("No probe succeeded, keeping provider order.")
+        return resolutions[0]
+    return ranked[0][0]
@@ -0,0 +1,125 @@
+import io
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional
+
+from cache import DEFAULT_CACHE_DIR
+
+if TYPE_CHECKING:
+    import pstats
+    import tracemalloc
+
+
+DEFAULT_PROFILE_DIR = os.path.join(DEFAULT_CACHE_DIR, "profiles")
+DEFAULT_TOP_FUNCTIONS = 15
+TRACEMALLOC_FRAMES = 1
+
+
+class Profiler:
+    def __init__(self, output_dir: str = DEFAULT_PROFILE_DIR, top: int = DEFAULT_TOP_FUNCTIONS):
+        import tracemalloc
+
+        self.run_dir = os.path.join(output_dir, time.strftime("%Y%m%d-%H%M%S"))
+        self.top = top
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats: Dict[str, "pstats.Stats"] = {}
+        self._calls: Dict[str, int] = {}
+        self._started_tracemalloc = not tracemalloc.is_tracing()
+        if self._started_tracemalloc:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        self._baseline = tracemalloc.take_snapshot()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        if getattr(self._local, "active", None) is not None:
+            yield
+            return
+        import cProfile
+        import pstats
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            yield
+            return
+        self._local.active = name
+        try:
+            yield
+        finally:
+            profile.disable()
+            self._local.active = None
+            with self._lock:
+                if name in self._stats:
+                    self._stats[name].add(profile)
+                else:
+                    self._stats[name] = pstats.Stats(profile)
+                self._calls[name] = self._calls.get(name, 0) + 1
+
+    def _function_summary(self) -> List[str]:
+        lines: List[str] = []
+        for name, stats in sorted(self._stats.items()):
+            buffer = io.StringIO()
+            stats.stream = buffer
+            stats.sort_stats("cumulative").print_stats(self.top)
+            lines.append(f"=== stage {name} ({self._calls[name]} runs) ===")
+            lines.extend(line for line in buffer.getvalue().splitlines() if line.strip())
+            lines.append("")
+        return lines
+
+    def _allocation_summary(self, snapshot: "tracemalloc.Snapshot") -> List[str]:
+        import tracemalloc
+
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [
+            "=== allocations ===",
+            f"traced memory: {current / 1024:.1f} KiB current, {peak / 1024:.1f} KiB peak",
+        ]
+        for stat in snapshot.compare_to(self._baseline, "lineno")[: self.top]:
+            lines.append(str(stat))
+        return lines
+
+    def finish(self) -> str:
+        import tracemalloc
+
+        os.makedirs(self.run_dir, exist_ok=True)
+        snapshot = tracemalloc.take_snapshot()
+        snapshot.dump(os.path.join(self.run_dir, "allocations.tracemalloc"))
+        with self._lock:
+            for name, stats in self._stats.items():
+                stats.dump_stats(os.path.join(self.run_dir, f"{name}.prof"))
+            lines = self._function_summary() + self._allocation_summary(snapshot)
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+
+        summary_path = os.path.join(self.run_dir, "summary.txt")
+        with open(summary_path, "w", encoding="utf-8") as handle:
+            handle.write("\n".join(lines) + "\n")
+        return summary_path
+
+
+_profiler: Optional[Profiler] = None
+
+
+def configure_profiling(output_dir: Optional[str] = DEFAULT_PROFILE_DIR) -> Optional[Profiler]:
+    global _profiler
+    _profiler = Profiler(output_dir) if output_dir else None
+    return _profiler
+
+
+def stop_profiling() -> Optional[str]:
+    global _profiler
+    profiler, _profiler = _profiler, None
+    return profiler.finish() if profiler is not None else None
+
+
+def get_profiler() -> Optional[Profiler]:
+    return _profiler
+
+
+def profile_stage(name: str):
+    profiler = _profiler
+    return profiler.stage(name) if profiler is not None else nullcontext()
@@ -0,0 +1,153 @@
+import importlib
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Pattern, Tuple
+from urllib.parse import urlparse
+
+
+EXTRACTOR_MODULE = "extractors"
+RANDOM_USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36"
+)
+LULUVDO_USER_AGENT = (
+    "Mozilla/5.0 (Android 15; Mobile; rv:132.0) Gecko/132.0 Firefox/132.0"
+)
+
+Extractor = Callable[..., str]
+
+
+@dataclass(frozen=True)
+class ProviderSpec:
+    name: str
+    extractor: Optional[str] = None
+    hosts: Tuple[str, ...] = ()
+    headers: Tuple[str, ...] = ()
+    patterns: Dict[str, Pattern] = field(default_factory=dict)
+    supports_range: bool = True
+    hls: bool = False
+    verify_tls: bool = True
+
+    @property
+    def supported(self) -> bool:
+        return self.extractor is not None
+
+
+def _patterns(**patterns: str) -> Dict[str, Pattern]:
+    return {name: re.compile(pattern) for name, pattern in patterns.items()}
+
+
+PROVIDERS: Dict[str, ProviderSpec] = {
+    spec.name: spec
+    for spec in (
+        ProviderSpec(
+            "VOE",
+            extractor="get_direct_link_from_voe",
+            hosts=("voe.sx",),
+            headers=(f"User-Agent: {RANDOM_USER_AGENT}",),
+            patterns=_patterns(
+                redirect=r"https?://[^'\"<>]+",
+                a168c=r"var a168c='([^']+)'",
+                hls=r"'hls': '(?P<hls>[^']+)'",
+            ),
+            hls=True,
+        ),
+        ProviderSpec(
+            "Vidoza",
+            extractor="get_direct_link_from_vidoza",
+            hosts=("vidoza.net", "videzz.net"),
+            patterns=_patterns(source=r'sourcesCode:\s*"([^"]+)"'),
+        ),
+        ProviderSpec(
+            "Vidmoly",
+            extractor="get_direct_link_from_vidmoly",
+            hosts=("vidmoly.to", "vidmoly.me", "vidmoly.net"),
+            headers=('Referer: "https://vidmoly.to"',),
+            patterns=_patterns(file=r'file:\s*"(https?://[^\"]+)"'),
+            hls=True,
+        ),
+        ProviderSpec(
+            "Doodstream",
+            extractor="get_direct_link_from_doodstream",
+            hosts=("dood.li", "dood.so", "dood.to", "dood.watch", "doodstream.com", "d0o0d.com", "ds2play.com"),
+            headers=('Referer: "https://dood.li/"',),
+            patterns=_patterns(
+                pass_md5=r"\$\.get\('([^']*\/pass_md5\/[^']*)'",
+                token=r"token=([a-zA-Z0-9]+)",
+            ),
+            verify_tls=False,
+        ),
+        ProviderSpec(
+            "LoadX",
+            extractor="get_direct_link_from_loadx",
+            hosts=("loadx.ws",),
+            headers=("Accept: */*",),
+            hls=True,
+            verify_tls=False,
+        ),
+        ProviderSpec(
+            "Filemoon",
+            extractor="get_direct_link_from_filemoon",
+            hosts=("filemoon.to", "filemoon.sx", "filemoon.in"),
+            headers=(f"User-Agent: {RANDOM_USER_AGENT}", 'Referer: "https://filemoon.to"'),
+            patterns=_patterns(file=r'file:\s*"([^"]+)"'),
+            hls=True,
+        ),
+        ProviderSpec(
+            "Luluvdo",
+            extractor="get_direct_link_from_luluvdo",
+            hosts=("luluvdo.com",),
+            headers=(
+                f"User-Agent: {LULUVDO_USER_AGENT}",
+                "Accept-Language: de-DE,de;q=0.9,en-US;q=0.8,en;q=0.7",
+                'Origin: "https://luluvdo.com"',
+                'Referer: "https://luluvdo.com/"',
+            ),
+            patterns=_patterns(file=r'file:\s*"([^"]+)"'),
+            hls=True,
+        ),
+        ProviderSpec("SpeedFiles", hosts=("speedfiles.net",)),
+        ProviderSpec("Streamtape", hosts=("streamtape.com", "streamtape.to")),
+        ProviderSpec("Hanime"),
+    )
+}
+
+PROVIDER_HEADERS: Dict[str, List[str]] = {name: list(spec.headers) for name, spec in PROVIDERS.items()}
+INSECURE_PROVIDERS = frozenset(name for name, spec in PROVIDERS.items() if not spec.verify_tls)
+
+_HOST_INDEX: Dict[str, str] = {host: spec.name for spec in PROVIDERS.values() for host in spec.hosts}
+_extractors: Dict[str, Extractor] = {}
+_extractors_lock = threading.Lock()
+
+
+def get_provider(name: str) -> Optional[ProviderSpec]:
+    return PROVIDERS.get(name)
+
+
+def is_supported(name: str) -> bool:
+    spec = PROVIDERS.get(name)
+    return spec is not None and spec.supported
+
+
+def provider_for_url(url: str) -> Optional[ProviderSpec]:
+    labels = (urlparse(url).hostname or "").lower().split(".")
+    for index in range(len(labels) - 1):
+        name = _HOST_INDEX.get(".".join(labels[index:]))
+        if name is not None:
+            return PROVIDERS[name]
+    return None
+
+
+def get_extractor(name: str) -> Optional[Extractor]:
+    extractor = _extractors.get(name)
+    if extractor is not None:
+        return extractor
+    spec = PROVIDERS.get(name)
+    if spec is None or spec.extractor is None:
+        return None
+    with _extractors_lock:
+        module = importlib.import_module(EXTRACTOR_MODULE)
+        extractor = getattr(module, spec.extractor)
+        _extractors[name] = extractor
+    return extractor
@@ -0,0 +1,378 @@
+import asyncio
+import contextvars
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from downloader import (
+    DEFAULT_PROBE_BYTES,
+    DEFAULT_SELECT,
+    DownloadCancelled,
+    LinkExpiredError,
+    discard_partial_download,
+    fetch_providers,
+    follow_redirect_to_embed,
+)
+from cache import direct_link_ttl, get_cache
+from health import get_health
+from metrics import host_of, span
+from providers import get_extractor, is_supported, provider_for_url
+from sessions import get_session
+
+
+HEALTH_GRACE_SECONDS = 2.0
+MAX_LINK_REFRESHES = 3
+
+@dataclass
+class Resolution:
+    provider: str
+    language_key: int
+    redirect_url: str
+    embed_url: str
+    direct_link: str
+
+
+def build_candidates(
+    providers: Dict[str, Dict[int, str]],
+    language_key: int = 3,
+) -> List[Tuple[str, int, str]]:
+    supported = {
+        name: lang_map
+        for name, lang_map in providers.items()
+        if is_supported(name)
+    }
+    candidates = [
+        (name, language_key, lang_map[language_key])
+        for name, lang_map in supported.items()
+        if language_key in lang_map
+    ]
+    if candidates:
+        return candidates
+
+    return [
+        (name, lang_key, lang_map[lang_key])
+        for name, lang_map in supported.items()
+        for lang_key in sorted(lang_map)
+    ]
+
+
+def _check_cancelled(cancel_event: Optional[threading.Event]) -> None:
+    if cancel_event is not None and cancel_event.is_set():
+        raise DownloadCancelled("Resolution no longer needed")
+
+
+def resolve_candidate(
+    provider: str,
+    language_key: int,
+    redirect_url: str,
+    cancel_event: Optional[threading.Event] = None,
+) -> Resolution:
+    if not is_supported(provider):
+        raise ValueError(f"Provider '{provider}' is not supported.")
+    _check_cancelled(cancel_event)
+    embed_url = follow_redirect_to_embed(redirect_url, session=get_session())
+    routed = provider_for_url(embed_url)
+    if routed is not None and routed.supported and routed.name != provider:
+        logging.info(f"Embed URL of {provider} is hosted by {routed.name}, using its extractor")
+        provider = routed.name
+    extractor_func = get_extractor(provider)
+
+    cache = get_cache()
+    if cache is not None:
+        cached = cache.get("direct", embed_url)
+        if cached:
+            return Resolution(provider, language_key, redirect_url, embed_url, cached)
+
+    _check_cancelled(cancel_event)
+    try:
+        with span("extract", provider=provider, host=host_of(embed_url)):
+            direct_link = extractor_func(embed_url, session=get_session(provider))
+    except Exception:
+        if cache is not None:
+            cache.invalidate("embed", redirect_url)
+        raise
+    _check_cancelled(cancel_event)
+    if cache is not None:
+        cache.set("direct", embed_url, direct_link, ttl=direct_link_ttl(direct_link))
+    return Resolution(provider, language_key, redirect_url, embed_url, direct_link)
+
+
+def invalidate_resolution(resolution: Resolution) -> None:
+    cache = get_cache()
+    if cache is None:
+        return
+    cache.invalidate("direct", resolution.embed_url)
+    cache.invalidate("embed", resolution.redirect_url)
+
+
+def rank_candidates(
+    candidates: List[Tuple[str, int, str]]
+) -> Tuple[List[Tuple[str, int, str]], List[Tuple[str, int, str]]]:
+    health = get_health()
+    if health is None:
+        return candidates, []
+    ranked = health.rank(candidates)
+    healthy = [c for c in ranked if not health.is_broken(c[0])]
+    broken = [c for c in ranked if health.is_broken(c[0])]
+    if broken:
+        logging.info("Deferring unhealthy providers: " + ", ".join(c[0] for c in broken))
+    return healthy, broken
+
+
+async def resolve_episode(
+    providers: Dict[str, Dict[int, str]],
+    language_key: int = 3,
+    max_workers: Optional[int] = None,
+) -> Resolution:
+    candidates = build_candidates(providers, language_key)
+    if not candidates:
+        raise ValueError("None of the available providers is supported.")
+
+    errors: List[str] = []
+    for group in rank_candidates(candidates):
+        if group:
+            resolution = await _race_candidates(group, max_workers, errors)
+            if resolution is not None:
+                return resolution
+    raise ValueError("All providers failed: " + "; ".join(errors))
+
+
+async def _race_candidates(
+    candidates: List[Tuple[str, int, str]],
+    max_workers: Optional[int],
+    errors: List[str],
+) -> Optional[Resolution]:
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=max_workers or len(candidates))
+    cancel_event = threading.Event()
+    order = {}
+    for index, candidate in enumerate(candidates):
+        future = loop.run_in_executor(
+            executor, contextvars.copy_context().run, resolve_candidate, *candidate, cancel_event
+        )
+        order[future] = index
+
+    pending = set(order)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in sorted(done, key=order.get):
+                provider = candidates[order[future]][0]
+                err = future.exception()
+                if err is not None:
+                    logging.info(f"Provider {provider} failed: {err}")
+                    errors.append(f"{provider}: {err}")
+                    continue
+                return future.result()
+    finally:
+        cancel_event.set()
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False, cancel_futures=True)
+    return None
+
+
+async def resolve_by_health(
+    providers: Dict[str, Dict[int, str]],
+    language_key: int = 3,
+    max_workers: Optional[int] = None,
+    grace: float = HEALTH_GRACE_SECONDS,
+) -> Resolution:
+    candidates = build_candidates(providers, language_key)
+    if not candidates:
+        raise ValueError("None of the available providers is supported.")
+
+    errors: List[str] = []
+    for group in rank_candidates(candidates):
+        if group:
+            resolution = await _pick_expected_fastest(group, max_workers, grace, errors)
+            if resolution is not None:
+                return resolution
+    raise ValueError("All providers failed: " + "; ".join(errors))
+
+
+async def _pick_expected_fastest(
+    candidates: List[Tuple[str, int, str]],
+    max_workers: Optional[int],
+    grace: float,
+    errors: List[str],
+) -> Optional[Resolution]:
+    health = get_health()
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=max_workers or len(candidates))
+    cancel_event = threading.Event()
+    futures = {
+        loop.run_in_executor(
+            executor, contextvars.copy_context().run, resolve_candidate, *candidate, cancel_event
+        ): candidate[0]
+        for candidate in candidates
+    }
+    pending = set(futures)
+    resolved: List[Resolution] = []
+    deadline: Optional[float] = None
+
+    def _expected(resolution: Resolution) -> float:
+        if health is None:
+            return 0.0
+        return health.expected_seconds(
+            resolution.provider, host_of(resolution.direct_link), resolved=True
+        )
+
+    try:
+        while pending:
+            timeout = None if deadline is None else max(0.0, deadline - loop.time())
+            done, pending = await asyncio.wait(
+                pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                break
+            for future in done:
+                err = future.exception()
+                if err is not None:
+                    logging.info(f"Provider {futures[future]} failed: {err}")
+                    errors.append(f"{futures[future]}: {err}")
+                    continue
+                resolved.append(future.result())
+            if not resolved:
+                continue
+            if health is None:
+                break
+            best = min(_expected(resolution) for resolution in resolved)
+            if all(health.expected_seconds(futures[f], resolved=True) >= best for f in pending):
+                break
+            if deadline is None:
+                deadline = loop.time() + grace
+    finally:
+        cancel_event.set()
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    if not resolved:
+        return None
+    return min(resolved, key=_expected)
+
+
+async def resolve_all(
+    providers: Dict[str, Dict[int, str]],
+    language_key: int = 3,
+    max_workers: Optional[int] = None,
+) -> List[Resolution]:
+    candidates = build_candidates(providers, language_key)
+    if not candidates:
+        raise ValueError("None of the available providers is supported.")
+
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=max_workers or len(candidates)) as executor:
+        results = await asyncio.gather(
+            *(
+                loop.run_in_executor(executor, contextvars.copy_context().run, resolve_candidate, *c)
+                for c in candidates
+            ),
+            return_exceptions=True,
+        )
+
+    resolutions: List[Resolution] = []
+    errors: List[str] = []
+    for (provider, _, _), result in zip(candidates, results):
+        if isinstance(result, Exception):
+            logging.info(f"Provider {provider} failed: {result}")
+            errors.append(f"{provider}: {result}")
+            continue
+        resolutions.append(result)
+
+    if not resolutions:
+        raise ValueError("All providers failed: " + "; ".join(errors))
+    return resolutions
+
+
+def select_resolution(
+    providers: Dict[str, Dict[int, str]],
+    language_key: int = 3,
+    select: str = DEFAULT_SELECT,
+    probe_bytes: int = DEFAULT_PROBE_BYTES,
+) -> Resolution:
+    if select == "fastest":
+        from probe import select_fastest
+
+        resolutions = asyncio.run(resolve_all(providers, language_key))
+        return select_fastest(resolutions, probe_bytes=probe_bytes)
+    if select == "health":
+        return asyncio.run(resolve_by_health(providers, language_key))
+    return asyncio.run(resolve_episode(providers, language_key))
+
+
+def resolve_episode_url(
+    episode_url: str,
+    language_key: int = 3,
+    select: str = DEFAULT_SELECT,
+    probe_bytes: int = DEFAULT_PROBE_BYTES,
+) -> Resolution:
+    providers = fetch_providers(episode_url)
+    return select_resolution(providers, language_key, select, probe_bytes)
+
+
+def refresh_resolution(
+    resolution: Resolution, episode_url: Optional[str] = None
+) -> Resolution:
+    invalidate_resolution(resolution)
+    try:
+        refreshed = resolve_candidate(
+            resolution.provider, resolution.language_key, resolution.redirect_url
+        )
+        if episode_url is None or refreshed.direct_link != resolution.direct_link:
+            return refreshed
+        logging.info(f"Provider {resolution.provider} returned the same rejected link")
+    except Exception as err:
+        if episode_url is None:
+            raise
+        logging.info(f"Provider {resolution.provider} could not be resolved again ({err})")
+
+    providers = fetch_providers(episode_url)
+    remaining = {
+        name: lang_map
+        for name, lang_map in providers.items()
+        if name != resolution.provider and resolution.redirect_url not in lang_map.values()
+    }
+    return select_resolution(remaining, resolution.language_key)
+
+
+def download_with_refresh(
+    resolution: Resolution,
+    output_path: str,
+    download: Callable[[Resolution], None],
+    episode_url: Optional[str] = None,
+    max_refreshes: int = MAX_LINK_REFRESHES,
+) -> Resolution:
+    refreshes = 0
+    while True:
+        try:
+            download(resolution)
+            return resolution
+        except LinkExpiredError as err:
+            if refreshes >= max_refreshes:
+                invalidate_resolution(resolution)
+                raise
+            refreshes += 1
+            logging.info(
+                f"Direct link from {resolution.provider} was rejected ({err}), "
+                f"resolving again ({refreshes}/{max_refreshes})"
+            )
+            try:
+                refreshed = refresh_resolution(resolution, episode_url)
+            except Exception as refresh_err:
+                raise LinkExpiredError(f"{err}; resolving again failed: {refresh_err}") from refresh_err
+            if refreshed.redirect_url != resolution.redirect_url:
+                logging.info(
+                    f"Switching from {resolution.provider} to {refreshed.provider}, "
+                    "discarding the partial download"
+                )
+                discard_partial_download(output_path)
+            resolution = refreshed
+        except DownloadCancelled:
+            raise
+        except Exception:
+            invalidate_resolution(resolution)
+            raise
@@ -0,0 +1,410 @@
+import json
+import logging
+import os
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from urllib.parse import urljoin
+
+import requests
+
+from downloader import (
+    DEFAULT_NATIVE_CONNECTIONS,
+    DEFAULT_REQUEST_TIMEOUT,
+    EXPIRED_STATUSES,
+    LinkExpiredError,
+)
+from pipeline import BandwidthBudget, ProgressEvent
+from probe import is_hls_url
+from providers import get_provider
+from sessions import get_session
+
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+READ_BLOCK_SIZE = 256 * 1024
+STATE_SUFFIX = ".state.json"
+PART_SUFFIX = ".part"
+SEGMENT_DIR_SUFFIX = ".segments"
+
+
+class UnsupportedStreamError(ValueError):
+    pass
+
+
+class _Progress:
+    def __init__(
+        self,
+        filename: str,
+        total_bytes: Optional[int],
+        downloaded_bytes: int,
+        on_progress: Optional[Callable[[ProgressEvent], None]],
+        bandwidth: Optional[BandwidthBudget],
+    ):
+        self.filename = filename
+        self.total_bytes = total_bytes
+        self.downloaded_bytes = downloaded_bytes
+        self.on_progress = on_progress
+        self.bandwidth = bandwidth
+        self.job_id = bandwidth.register() if bandwidth is not None else None
+        self.started_at = time.monotonic()
+        self.started_bytes = downloaded_bytes
+        self._lock = threading.Lock()
+
+    def add(self, nbytes: int) -> None:
+        if self.job_id is not None:
+            self.bandwidth.consume(self.job_id, nbytes)
+        with self._lock:
+            self.downloaded_bytes += nbytes
+            event = self.event("downloading")
+        if self.on_progress is not None:
+            self.on_progress(event)
+
+    def event(self, status: str) -> ProgressEvent:
+        elapsed = time.monotonic() - self.started_at
+        speed = (self.downloaded_bytes - self.started_bytes) / elapsed if elapsed > 0 else None
+        eta = None
+        if speed and self.total_bytes:
+            eta = max(0.0, (self.total_bytes - self.downloaded_bytes) / speed)
+        return ProgressEvent(
+            status=status,
+            filename=self.filename,
+            downloaded_bytes=self.downloaded_bytes,
+            total_bytes=self.total_bytes,
+            speed=speed,
+            eta=eta,
+        )
+
+    def close(self, status: str = "finished") -> None:
+        if self.job_id is not None:
+            self.bandwidth.unregister(self.job_id)
+        if self.on_progress is not None:
+            self.on_progress(self.event(status))
+
+
+def _run_parallel(func: Callable, items: List, workers: int) -> None:
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        for future in [executor.submit(func, item) for item in items]:
+            future.result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _load_state(state_path: str, expected: Dict) -> Dict:
+    try:
+        with open(state_path, encoding="utf-8") as handle:
+            state = json.load(handle)
+    except (OSError, ValueError):
+        return dict(expected, done=[])
+    if any(state.get(key) != value for key, value in expected.items()):
+        return dict(expected, done=[])
+    return state
+
+
+def _save_state(state_path: str, state: Dict) -> None:
+    tmp_path = state_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as handle:
+        json.dump(state, handle)
+    os.replace(tmp_path, state_path)
+
+
+def _probe_size(
+    url: str, session: requests.Session
+) -> Tuple[Optional[int], bool, str]:
+    with session.get(
+        url,
+        headers={"Range": "bytes=0-0"},
+        timeout=DEFAULT_REQUEST_TIMEOUT,
+        stream=True,
+    ) as resp:
+        resp.raise_for_status()
+        content_type = resp.headers.get("Content-Type", "")
+        content_range = resp.headers.get("Content-Range", "")
+        if resp.status_code == 206 and "/" in content_range:
+            total = content_range.rsplit("/", 1)[1]
+            return (int(total) if total.isdigit() else None), True, content_type
+        length = resp.headers.get("Content-Length")
+        return (int(length) if length and length.isdigit() else None), False, content_type
+
+
+def _fetch_range(
+    url: str,
+    session: requests.Session,
+    path: str,
+    start: int,
+    end: int,
+    progress: _Progress,
+) -> None:
+    with session.get(
+        url,
+        headers={"Range": f"bytes={start}-{end}"},
+        timeout=DEFAULT_REQUEST_TIMEOUT,
+        stream=True,
+    ) as resp:
+        resp.raise_for_status()
+        if resp.status_code != 206:
+            raise RuntimeError(f"Server ignored range request for bytes {start}-{end}")
+        with open(path, "r+b") as handle:
+            handle.seek(start)
+            written = 0
+            for block in resp.iter_content(READ_BLOCK_SIZE):
+                handle.write(block)
+                written += len(block)
+                progress.add(len(block))
+    if written != end - start + 1:
+        raise RuntimeError(f"Incomplete range {start}-{end}: got {written} bytes")
+
+
+def _download_single_stream(
+    url: str, output_path: str, session: requests.Session, progress: _Progress
+) -> None:
+    part_path = output_path + PART_SUFFIX
+    with session.get(url, timeout=DEFAULT_REQUEST_TIMEOUT, stream=True) as resp:
+        resp.raise_for_status()
+        with open(part_path, "wb") as handle:
+            for block in resp.iter_content(READ_BLOCK_SIZE):
+                handle.write(block)
+                progress.add(len(block))
+    os.replace(part_path, output_path)
+
+
+def download_direct(
+    url: str,
+    output_path: str,
+    session: Optional[requests.Session] = None,
+    connections: int = DEFAULT_NATIVE_CONNECTIONS,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    on_progress: Optional[Callable[[ProgressEvent], None]] = None,
+    bandwidth: Optional[BandwidthBudget] = None,
+) -> None:
+    session = session or get_session()
+    size, supports_range, content_type = _probe_size(url, session)
+    if "mpegurl" in content_type.lower():
+        raise UnsupportedStreamError("Direct link points to an HLS playlist.")
+
+    if not supports_range or not size:
+        logging.info("Server does not support range requests, using a single connection.")
+        progress = _Progress(output_path, size, 0, on_progress, bandwidth)
+        try:
+            _download_single_stream(url, output_path, session, progress)
+        finally:
+            progress.close()
+        return
+
+    part_path = output_path + PART_SUFFIX
+    state_path = output_path + STATE_SUFFIX
+    state = _load_state(state_path, {"kind": "direct", "size": size, "chunk_size": chunk_size})
+    if not os.path.exists(part_path):
+        state["done"] = []
+    with open(part_path, "r+b" if os.path.exists(part_path) else "wb") as handle:
+        handle.truncate(size)
+
+    chunks = [
+        (index, start, min(start + chunk_size, size) - 1)
+        for index, start in enumerate(range(0, size, chunk_size))
+    ]
+    done: Set[int] = set(state["done"])
+    pending = [chunk for chunk in chunks if chunk[0] not in done]
+    already = sum(end - start + 1 for index, start, end in chunks if index in done)
+    if done:
+        logging.info(f"Resuming {output_path}: {len(done)}/{len(chunks)} chunks already on disk")
+
+    progress = _Progress(output_path, size, already, on_progress, bandwidth)
+    lock = threading.Lock()
+
+    def _worker(chunk: Tuple[int, int, int]) -> None:
+        index, start, end = chunk
+        _fetch_range(url, session, part_path, start, end, progress)
+        with lock:
+            done.add(index)
+            state["done"] = sorted(done)
+            _save_state(state_path, state)
+
+    try:
+        _run_parallel(_worker, pending, connections)
+    except Exception:
+        progress.close("error")
+        raise
+
+    os.replace(part_path, output_path)
+    os.remove(state_path)
+    progress.close()
+
+
+def _parse_attributes(line: str) -> Dict[str, str]:
+    attributes = {}
+    for part in line.split(":", 1)[-1].split(","):
+        name, sep, value = part.partition("=")
+        if sep:
+            attributes[name.strip().upper()] = value.strip().strip('"')
+    return attributes
+
+
+def load_media_playlist(
+    playlist_url: str, session: requests.Session
+) -> Tuple[str, List[str]]:
+    resp = session.get(playlist_url, timeout=DEFAULT_REQUEST_TIMEOUT)
+    resp.raise_for_status()
+    lines = [line.strip() for line in resp.text.splitlines() if line.strip()]
+
+    if any(line.startswith("#EXT-X-STREAM-INF") for line in lines):
+        best_bandwidth, best_uri = -1, None
+        for index, line in enumerate(lines):
+            if not line.startswith("#EXT-X-STREAM-INF") or index + 1 >= len(lines):
+                continue
+            bandwidth = int(_parse_attributes(line).get("BANDWIDTH", "0") or 0)
+            if bandwidth > best_bandwidth:
+                best_bandwidth, best_uri = bandwidth, lines[index + 1]
+        if best_uri is None:
+            raise ValueError("No variant streams found in HLS master playlist.")
+        return load_media_playlist(urljoin(resp.url, best_uri), session)
+
+    segments = []
+    for line in lines:
+        if line.startswith("#EXT-X-KEY"):
+            method = _parse_attributes(line).get("METHOD", "NONE")
+            if method.upper() != "NONE":
+                raise UnsupportedStreamError(f"Encrypted HLS ({method}) is not supported.")
+        elif line.startswith("#EXT-X-MAP"):
+            uri = _parse_attributes(line).get("URI")
+            if uri:
+                segments.append(urljoin(resp.url, uri))
+        elif not line.startswith("#"):
+            segments.append(urljoin(resp.url, line))
+    if not segments:
+        raise ValueError("No segments found in HLS playlist.")
+    return resp.url, segments
+
+
+def _remux(source_path: str, output_path: str) -> bool:
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        return False
+    result = subprocess.run(
+        [ffmpeg, "-y", "-loglevel", "error", "-i", source_path, "-c", "copy", output_path],
+        check=False,
+    )
+    return result.returncode == 0
+
+
+def download_hls(
+    playlist_url: str,
+    output_path: str,
+    session: Optional[requests.Session] = None,
+    connections: int = DEFAULT_NATIVE_CONNECTIONS,
+    on_progress: Optional[Callable[[ProgressEvent], None]] = None,
+    bandwidth: Optional[BandwidthBudget] = None,
+) -> None:
+    session = session or get_session()
+    media_url, segments = load_media_playlist(playlist_url, session)
+
+    part_path = output_path + PART_SUFFIX
+    state_path = output_path + STATE_SUFFIX
+    segment_dir = output_path + SEGMENT_DIR_SUFFIX
+    os.makedirs(segment_dir, exist_ok=True)
+    state = _load_state(state_path, {"kind": "hls", "segments": len(segments)})
+    state.setdefault("assembled", 0)
+    state.setdefault("assembled_bytes", 0)
+    part_size = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    if part_size < state["assembled_bytes"] or (state["assembled"] and not os.path.exists(part_path)):
+        if state["assembled"]:
+            logging.info(f"{part_path} is shorter than recorded, assembling from the first segment")
+        state["done"], state["assembled"], state["assembled_bytes"] = [], 0, 0
+    with open(part_path, "ab"):
+        pass
+
+    done: Set[int] = set(state["done"])
+    assembled = state["assembled"]
+    with open(part_path, "r+b") as handle:
+        handle.truncate(state["assembled_bytes"])
+    if assembled:
+        logging.info(f"Resuming {output_path}: {assembled}/{len(segments)} segments assembled")
+
+    progress = _Progress(output_path, None, state["assembled_bytes"], on_progress, bandwidth)
+    lock = threading.Lock()
+
+    def _segment_path(index: int) -> str:
+        return os.path.join(segment_dir, f"{index:06d}.ts")
+
+    def _assemble_ready() -> None:
+        nonlocal assembled
+        with open(part_path, "ab") as out:
+            while assembled in done and assembled < len(segments):
+                path = _segment_path(assembled)
+                with open(path, "rb") as segment:
+                    shutil.copyfileobj(segment, out)
+                os.remove(path)
+                assembled += 1
+            state["assembled_bytes"] = out.tell()
+        state["assembled"] = assembled
+
+    def _worker(index: int) -> None:
+        path = _segment_path(index)
+        with session.get(segments[index], timeout=DEFAULT_REQUEST_TIMEOUT, stream=True) as resp:
+            resp.raise_for_status()
+            with open(path + ".tmp", "wb") as handle:
+                for block in resp.iter_content(READ_BLOCK_SIZE):
+                    handle.write(block)
+                    progress.add(len(block))
+        os.replace(path + ".tmp", path)
+        with lock:
+            done.add(index)
+            _assemble_ready()
+            state["done"] = sorted(i for i in done if i >= assembled)
+            _save_state(state_path, state)
+
+    pending = [
+        index for index in range(assembled, len(segments))
+        if index not in done or not os.path.exists(_segment_path(index))
+    ]
+    done.difference_update(pending)
+    try:
+        with lock:
+            _assemble_ready()
+        _run_parallel(_worker, pending, connections)
+    except Exception:
+        progress.close("error")
+        raise
+
+    if assembled != len(segments):
+        progress.close("error")
+        raise RuntimeError(f"Only {assembled} of {len(segments)} segments were assembled.")
+
+    if not (output_path.lower().endswith(".mp4") and _remux(part_path, output_path)):
+        os.replace(part_path, output_path)
+    else:
+        os.remove(part_path)
+    os.remove(state_path)
+    shutil.rmtree(segment_dir, ignore_errors=True)
+    progress.close()
+
+
+def download_native(
+    direct_link: str,
+    output_path: str,
+    provider: Optional[str] = None,
+    connections: int = DEFAULT_NATIVE_CONNECTIONS,
+    on_progress: Optional[Callable[[ProgressEvent], None]] = None,
+    bandwidth: Optional[BandwidthBudget] = None,
+) -> None:
+    session = get_session(provider)
+    spec = get_provider(provider) if provider else None
+    range_connections = connections if spec is None or spec.supports_range else 1
+    try:
+        if is_hls_url(direct_link):
+            download_hls(direct_link, output_path, session, connections, on_progress, bandwidth)
+            return
+        try:
+            download_direct(
+                direct_link, output_path, session, range_connections, on_progress=on_progress, bandwidth=bandwidth
+            )
+        except UnsupportedStreamError:
+            download_hls(direct_link, output_path, session, connections, on_progress, bandwidth)
+    except requests.HTTPError as err:
+        status = err.response.status_code if err.response is not None else None
+        if status in EXPIRED_STATUSES:
+            raise LinkExpiredError(f"Direct link rejected with HTTP {status}") from err
+        raise
@@ -0,0 +1,114 @@
+import threading
+from typing import Dict, FrozenSet, Iterable, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from politeness import PolitenessScheduler, PoliteSession
+
+
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 10
+
+
+def parse_header_lines(lines: List[str]) -> Dict[str, str]:
+    headers: Dict[str, str] = {}
+    for line in lines:
+        name, sep, value = line.partition(":")
+        if not sep or not name.strip():
+            continue
+        headers[name.strip()] = value.strip().strip('"')
+    return headers
+
+
+class SessionManager:
+    def __init__(
+        self,
+        provider_headers: Optional[Dict[str, List[str]]] = None,
+        default_headers: Optional[Dict[str, str]] = None,
+        pool_connections: int = DEFAULT_POOL_CONNECTIONS,
+        pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+        scheduler: Optional[PolitenessScheduler] = None,
+        insecure_providers: Iterable[str] = (),
+    ):
+        self.provider_headers = provider_headers or {}
+        self.insecure_providers: FrozenSet[str] = frozenset(insecure_providers)
+        self.default_headers = default_headers or {}
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.scheduler = scheduler or PolitenessScheduler()
+        self._sessions: Dict[str, requests.Session] = {}
+        self._lock = threading.Lock()
+
+    def get(self, provider: Optional[str] = None) -> requests.Session:
+        key = provider or ""
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = self._create_session(provider)
+                self._sessions[key] = session
+            return session
+
+    def _create_session(self, provider: Optional[str]) -> requests.Session:
+        session = PoliteSession(self.scheduler)
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers.update(self.default_headers)
+        if provider:
+            session.headers.update(
+                parse_header_lines(self.provider_headers.get(provider, []))
+            )
+            if provider in self.insecure_providers:
+                session.verify = False
+        return session
+
+    def close(self) -> None:
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
+
+
+_default_manager: Optional[SessionManager] = None
+_default_lock = threading.Lock()
+
+
+def configure_sessions(
+    provider_headers: Optional[Dict[str, List[str]]] = None,
+    default_headers: Optional[Dict[str, str]] = None,
+    pool_connections: int = DEFAULT_POOL_CONNECTIONS,
+    pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+    scheduler: Optional[PolitenessScheduler] = None,
+    insecure_providers: Iterable[str] = (),
+) -> SessionManager:
+    global _default_manager
+    manager = SessionManager(
+        provider_headers=provider_headers,
+        default_headers=default_headers,
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        scheduler=scheduler,
+        insecure_providers=insecure_providers,
+    )
+    with _default_lock:
+        previous, _default_manager = _default_manager, manager
+    if previous is not None:
+        previous.close()
+    return manager
+
+
+def get_session_manager() -> SessionManager:
+    global _default_manager
+    with _default_lock:
+        if _default_manager is None:
+            _default_manager = SessionManager()
+        return _default_manager
+
+
+def get_session(provider: Optional[str] = None) -> requests.Session:
+    return get_session_manager().get(provider)
@@ -0,0 +1,180 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+from cache import DEFAULT_CACHE_DIR
+from downloader import DEFAULT_FRAGMENT_CONCURRENCY
+
+
+DEFAULT_TUNING_PATH = os.path.join(DEFAULT_CACHE_DIR, "fragment_tuning.json")
+MIN_CONCURRENCY = 1
+MAX_CONCURRENCY = 16
+CONCURRENCY_STEP = 2
+MIN_SAMPLE_BYTES = 16 * 1024 * 1024
+THROUGHPUT_GAIN = 1.1
+BEST_THROUGHPUT_DECAY = 0.97
+MAX_ERROR_RATE = 0.05
+RATELIMIT_BACKOFF = 0.8
+RATELIMIT_RELAX = 1.25
+CEILING_CLEAN_RUNS = 5
+RETRY_MARKERS = ("Got error:", "Retrying fragment")
+THROTTLE_MARKERS = ("HTTP Error 429", "HTTP Error 503", "Too Many Requests")
+
+
+def host_key(url: str) -> str:
+    host = (urlparse(url).hostname or "").lower()
+    labels = host.split(".")
+    if len(labels) <= 2 or labels[-1].isdigit():
+        return host
+    return ".".join(labels[-2:])
+
+
+class FragmentStats:
+    def __init__(self):
+        self.fragments = 0
+        self.retries = 0
+        self.throttled = 0
+        self.downloaded_bytes = 0
+        self._started: Optional[float] = None
+        self._finished: Optional[float] = None
+
+    def observe_hook(self, status: Dict[str, Any]) -> None:
+        now = time.monotonic()
+        if self._started is None:
+            self._started = now
+        self._finished = now
+        self.downloaded_bytes = max(self.downloaded_bytes, status.get("downloaded_bytes") or 0)
+        self.fragments = max(
+            self.fragments, status.get("fragment_index") or 0, status.get("fragment_count") or 0
+        )
+
+    def observe_log(self, message: str) -> None:
+        if not any(marker in message for marker in RETRY_MARKERS):
+            return
+        self.retries += 1
+        if any(marker in message for marker in THROTTLE_MARKERS):
+            self.throttled += 1
+
+    @property
+    def throughput(self) -> Optional[float]:
+        if self.downloaded_bytes < MIN_SAMPLE_BYTES or self._started is None:
+            return None
+        elapsed = self._finished - self._started
+        return self.downloaded_bytes / elapsed if elapsed > 0 else None
+
+    @property
+    def error_rate(self) -> float:
+        return self.retries / max(1, self.fragments)
+
+
+class FragmentTuner:
+    def __init__(self, path: str = DEFAULT_TUNING_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._hosts: Dict[str, Dict[str, Any]] = self._load()
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.path, encoding="utf-8") as handle:
+                data = json.load(handle)
+        except (OSError, ValueError):
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def _save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as handle:
+            json.dump(self._hosts, handle, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def settings_for(self, url: str) -> Tuple[int, Optional[int]]:
+        with self._lock:
+            entry = self._hosts.get(host_key(url))
+        if entry is None:
+            return DEFAULT_FRAGMENT_CONCURRENCY, None
+        return entry["concurrency"], entry.get("ratelimit")
+
+    def record(self, url: str, stats: FragmentStats, measure_throughput: bool = True) -> Dict[str, Any]:
+        if stats.fragments == 0 and not stats.retries:
+            return {}
+        with self._lock:
+            entry = self._hosts.setdefault(
+                host_key(url),
+                {
+                    "concurrency": DEFAULT_FRAGMENT_CONCURRENCY,
+                    "ratelimit": None,
+                    "best_concurrency": DEFAULT_FRAGMENT_CONCURRENCY,
+                    "best_throughput": 0.0,
+                    "ceiling": None,
+                    "clean_runs": 0,
+                    "runs": 0,
+                },
+            )
+            throughput = stats.throughput if measure_throughput else None
+            if stats.throttled or stats.error_rate > MAX_ERROR_RATE:
+                self._back_off(entry, throughput, stats.throttled > 0)
+            else:
+                self._probe(entry, throughput)
+            entry["runs"] += 1
+            entry["updated_at"] = time.time()
+            try:
+                self._save()
+            except OSError:
+                pass
+            return dict(entry)
+
+    def _back_off(self, entry: Dict[str, Any], throughput: Optional[float], throttled: bool) -> None:
+        concurrency = entry["concurrency"]
+        entry["ceiling"] = concurrency
+        entry["clean_runs"] = 0
+        if concurrency > MIN_CONCURRENCY:
+            entry["concurrency"] = max(MIN_CONCURRENCY, concurrency // 2)
+        elif throttled and throughput:
+            entry["ratelimit"] = int(throughput * RATELIMIT_BACKOFF)
+        elif throttled and entry.get("ratelimit"):
+            entry["ratelimit"] = int(entry["ratelimit"] * RATELIMIT_BACKOFF)
+        entry["best_concurrency"] = entry["concurrency"]
+        entry["best_throughput"] = 0.0
+
+    def _probe(self, entry: Dict[str, Any], throughput: Optional[float]) -> None:
+        entry["clean_runs"] += 1
+        if entry["ceiling"] is not None and entry["clean_runs"] >= CEILING_CLEAN_RUNS:
+            entry["ceiling"] = None
+        if entry.get("ratelimit"):
+            if entry["ceiling"] is None:
+                entry["ratelimit"] = None
+            else:
+                entry["ratelimit"] = int(entry["ratelimit"] * RATELIMIT_RELAX)
+            return
+        if throughput is None:
+            return
+
+        concurrency = entry["concurrency"]
+        if throughput >= entry["best_throughput"] * THROUGHPUT_GAIN:
+            entry["best_throughput"] = throughput
+            entry["best_concurrency"] = concurrency
+            limit = MAX_CONCURRENCY if entry["ceiling"] is None else entry["ceiling"] - 1
+            entry["concurrency"] = max(MIN_CONCURRENCY, min(limit, concurrency + CONCURRENCY_STEP))
+        else:
+            if concurrency == entry["best_concurrency"]:
+                entry["best_throughput"] = max(
+                    entry["best_throughput"] * BEST_THROUGHPUT_DECAY, throughput
+                )
+            entry["concurrency"] = entry["best_concurrency"]
+
+
+_tuner: Optional[FragmentTuner] = None
+
+
+def configure_tuning(path: Optional[str] = DEFAULT_TUNING_PATH) -> Optional[FragmentTuner]:
+    global _tuner
+    _tuner = FragmentTuner(path) if path else None
+    return _tuner
+
+
+def get_tuner() -> Optional[FragmentTuner]:
+    return _tuner
@@ -0,0 +1,315 @@
+import argparse
+import json
+import logging
+import os
+import random
+import threading
+import time
+import urllib.request
+from dataclasses import asdict, dataclass, field, fields
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+from batch import SERIES_PATH_RE
+from cache import DEFAULT_CACHE_DIR
+from crawler import DEFAULT_CATALOG_PATH, Catalog, Crawler
+
+
+DEFAULT_WATCHLIST_PATH = os.path.join(DEFAULT_CACHE_DIR, "watchlist.json")
+DEFAULT_WATCH_QUEUE_PATH = os.path.join(DEFAULT_CACHE_DIR, "watch_queue.json")
+DEFAULT_INTERVAL = 3600.0
+MIN_INTERVAL = 300.0
+INTERVAL_JITTER = 0.2
+MAX_IDLE_SLEEP = 60.0
+
+Enqueue = Callable[[List[str], Optional[str], int], None]
+
+
+@dataclass
+class Follow:
+    url: str
+    slug: str
+    language_key: int = 3
+    output_dir: Optional[str] = None
+    interval: float = DEFAULT_INTERVAL
+    next_check: float = 0.0
+    last_checked: Optional[float] = None
+    last_error: Optional[str] = None
+    delivered: List[str] = field(default_factory=list)
+
+
+def series_slug(url: str) -> str:
+    match = SERIES_PATH_RE.search(urlparse(url).path)
+    if not match:
+        raise ValueError(f"Not a series URL: {url}")
+    return match.group(1)
+
+
+def jittered(interval: float) -> float:
+    return interval * random.uniform(1 - INTERVAL_JITTER, 1 + INTERVAL_JITTER)
+
+
+class Watcher:
+    def __init__(
+        self,
+        catalog: Catalog,
+        enqueue: Optional[Enqueue] = None,
+        path: Optional[str] = DEFAULT_WATCHLIST_PATH,
+    ):
+        self.catalog = catalog
+        self.enqueue = enqueue
+        self.path = path
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self.follows: Dict[str, Follow] = self._read()
+        self._known = set(self.follows)
+
+    def _read(self) -> Dict[str, Follow]:
+        if not self.path:
+            return {}
+        try:
+            with open(self.path, encoding="utf-8") as handle:
+                entries = json.load(handle)
+        except (OSError, ValueError):
+            return {}
+        follows = [Follow(**entry) for entry in entries if isinstance(entry, dict)]
+        return {follow.url: follow for follow in follows}
+
+    def _merge(self, on_disk: Dict[str, Follow]) -> None:
+        for url in list(self.follows):
+            if url not in on_disk and url in self._known:
+                del self.follows[url]
+        for url, stored in on_disk.items():
+            current = self.follows.get(url)
+            if current is None:
+                if url not in self._known:
+                    self.follows[url] = stored
+                continue
+            if (stored.last_checked or 0) <= (current.last_checked or 0):
+                continue
+            delivered = current.delivered
+            for name in (f.name for f in fields(Follow)):
+                setattr(current, name, getattr(stored, name))
+            known = set(current.delivered)
+            current.delivered.extend(episode_url for episode_url in delivered if episode_url not in known)
+        self._known = set(on_disk)
+
+    def sync(self) -> None:
+        if not self.path:
+            return
+        with self._lock:
+            self._merge(self._read())
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        with self._lock:
+            self._merge(self._read())
+            entries = [asdict(follow) for follow in self.follows.values()]
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as handle:
+                json.dump(entries, handle, indent=2)
+            os.replace(tmp_path, self.path)
+            self._known = set(self.follows)
+
+    def _available(self, follow: Follow) -> List[str]:
+        return [entry["url"] for entry in self.catalog.query(language_key=follow.language_key, slug=follow.slug)]
+
+    def follow(
+        self,
+        url: str,
+        language_key: int = 3,
+        output_dir: Optional[str] = None,
+        interval: float = DEFAULT_INTERVAL,
+        backfill: bool = False,
+    ) -> Follow:
+        url = url.rstrip("/")
+        follow = Follow(url, series_slug(url), language_key, output_dir, max(MIN_INTERVAL, interval))
+        Crawler(self.catalog).crawl(url)
+        if not backfill:
+            follow.delivered = self._available(follow)
+        follow.last_checked = time.time()
+        follow.next_check = follow.last_checked + (jittered(follow.interval) if not backfill else 0.0)
+        with self._lock:
+            self.follows[url] = follow
+        self.save()
+        self._wakeup.set()
+        return follow
+
+    def unfollow(self, url: str) -> bool:
+        with self._lock:
+            removed = self.follows.pop(url.rstrip("/"), None)
+        if removed is not None:
+            self.save()
+        return removed is not None
+
+    def check(self, follow: Follow) -> List[str]:
+        stats = Crawler(self.catalog).crawl(follow.url)
+        delivered = set(follow.delivered)
+        new = [url for url in self._available(follow) if url not in delivered]
+        if new and self.enqueue is not None:
+            self.enqueue(new, follow.output_dir, follow.language_key)
+            logging.info(f"{follow.slug}: queued {len(new)} new episodes")
+        with self._lock:
+            if self.enqueue is not None:
+                follow.delivered.extend(new)
+            follow.last_checked = time.time()
+            follow.next_check = follow.last_checked + jittered(follow.interval)
+            follow.last_error = f"{stats.failed} pages failed" if stats.failed else None
+        return new
+
+    def check_due(self) -> List[str]:
+        self.sync()
+        now = time.time()
+        with self._lock:
+            due = sorted(
+                (follow for follow in self.follows.values() if follow.next_check <= now),
+                key=lambda follow: follow.next_check,
+            )
+        queued: List[str] = []
+        for follow in due:
+            try:
+                queued.extend(self.check(follow))
+            except Exception as err:
+                logging.error(f"Checking {follow.url} failed: {err}")
+                with self._lock:
+                    follow.last_error = str(err)
+                    follow.next_check = time.time() + jittered(follow.interval)
+        if due:
+            self.save()
+        return queued
+
+    def seconds_until_next(self) -> float:
+        with self._lock:
+            if not self.follows:
+                return MAX_IDLE_SLEEP
+            earliest = min(follow.next_check for follow in self.follows.values())
+        return min(MAX_IDLE_SLEEP, max(0.0, earliest - time.time()))
+
+    def run(self, stop_event: threading.Event) -> None:
+        while not stop_event.is_set():
+            self.check_due()
+            self._wakeup.wait(self.seconds_until_next())
+            self._wakeup.clear()
+
+    def start(self, stop_event: threading.Event) -> threading.Thread:
+        thread = threading.Thread(target=self.run, args=(stop_event,), name="watcher", daemon=True)
+        thread.start()
+        return thread
+
+
+def daemon_enqueue(daemon_url: str) -> Enqueue:
+    def _enqueue(urls: List[str], output_dir: Optional[str], language_key: int) -> None:
+        payload = {"urls": urls, "language": language_key}
+        if output_dir:
+            payload["output_dir"] = output_dir
+        request = urllib.request.Request(
+            daemon_url.rstrip("/") + "/jobs",
+            data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=30) as resp:
+            resp.read()
+
+    return _enqueue
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="watcher.py",
+        description="Follow series and queue new episodes for download as they appear.",
+    )
+    parser.add_argument("--watchlist-path", default=DEFAULT_WATCHLIST_PATH)
+    parser.add_argument("--catalog-path", default=DEFAULT_CATALOG_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    follow = commands.add_parser("follow", help="follow a series")
+    follow.add_argument("series_url")
+    follow.add_argument("--language", type=int, default=3, help="data-lang-key to download")
+    follow.add_argument("--output-dir", default=None)
+    follow.add_argument("--interval", type=float, default=DEFAULT_INTERVAL, help="seconds between checks")
+    follow.add_argument(
+        "--backfill", action="store_true", help="also queue the episodes that are already available"
+    )
+
+    unfollow = commands.add_parser("unfollow", help="stop following a series")
+    unfollow.add_argument("series_url")
+
+    commands.add_parser("list", help="show followed series")
+
+    run = commands.add_parser("run", help="poll followed series and queue new episodes")
+    run.add_argument(
+        "--daemon-url",
+        default=None,
+        help="queue episodes on a running daemon.py instead of downloading in this process",
+    )
+    run.add_argument("--output-dir", default=os.getcwd())
+    run.add_argument("--parallel", type=int, default=2)
+    run.add_argument("--once", action="store_true", help="check due series once and exit")
+    return parser
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    args = build_arg_parser().parse_args()
+    catalog = Catalog(args.catalog_path)
+
+    if args.command == "list":
+        watcher = Watcher(catalog, path=args.watchlist_path)
+        for follow in watcher.follows.values():
+            next_check = time.strftime("%Y-%m-%d %H:%M", time.localtime(follow.next_check))
+            error = f"  ({follow.last_error})" if follow.last_error else ""
+            print(
+                f"{follow.url}  language {follow.language_key}  every {follow.interval / 60:.0f} min  "
+                f"next {next_check}  {len(follow.delivered)} delivered{error}"
+            )
+        return
+
+    if args.command == "unfollow":
+        watcher = Watcher(catalog, path=args.watchlist_path)
+        if not watcher.unfollow(args.series_url):
+            print(f"Not following {args.series_url}")
+        return
+
+    from pipeline import configure_pipeline
+
+    configure_pipeline()
+    if args.command == "follow":
+        watcher = Watcher(catalog, path=args.watchlist_path)
+        follow = watcher.follow(
+            args.series_url, args.language, args.output_dir, args.interval, args.backfill
+        )
+        print(f"Following {follow.url}, {len(follow.delivered)} episodes already available")
+        return
+
+    manager = None
+    if args.daemon_url:
+        enqueue = daemon_enqueue(args.daemon_url)
+    else:
+        from daemon import JobManager
+
+        manager = JobManager(args.output_dir, queue_path=DEFAULT_WATCH_QUEUE_PATH, parallel=args.parallel)
+        manager.start()
+
+        def enqueue(urls: List[str], output_dir: Optional[str], language_key: int) -> None:
+            manager.submit(urls, output_dir=output_dir, language_key=language_key)
+
+    watcher = Watcher(catalog, enqueue, path=args.watchlist_path)
+    if args.once:
+        queued = watcher.check_due()
+        print(f"Queued {len(queued)} episodes")
+        if manager is not None:
+            manager.wait_until_idle()
+        return
+
+    stop_event = threading.Event()
+    try:
+        watcher.run(stop_event)
+    except KeyboardInterrupt:
+        stop_event.set()
+
+
+if __name__ == "__main__":
+    main()